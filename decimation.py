@@ -0,0 +1,99 @@
+import numpy as np
+
+# Reduces a signal to roughly as many points as the figure has pixel columns
+# before it reaches matplotlib. A 10 inch figure at 100 dpi cannot show more
+# than ~1000 distinct x positions, so anything beyond that only costs time.
+DECIMATION_METHODS = ("minmax", "lttb", "none")
+
+
+def _first_per_segment(idx, seg):
+    """Keeps the first index of each segment from a sorted index array."""
+    if len(idx) == 0:
+        return idx
+    keep = np.empty(len(idx), dtype=bool)
+    keep[0] = True
+    keep[1:] = seg[idx][1:] != seg[idx][:-1]
+    return idx[keep]
+
+
+def minmax_decimate(x, y, n_bins):
+    """Keeps the minimum and maximum sample of each of n_bins equal-width x columns.
+
+    The visual envelope of the signal (spikes included) is preserved exactly
+    at the target resolution. x must be sorted.
+    """
+    n = len(x)
+    if n <= 2 * n_bins:
+        return x, y
+
+    edges = np.linspace(x[0], x[-1], n_bins + 1)
+    bin_idx = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, n_bins - 1)
+
+    # Start of every non-empty column, and the column each sample belongs to
+    starts = np.flatnonzero(np.diff(bin_idx)) + 1
+    starts = np.concatenate(([0], starts))
+    seg = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+
+    mins = np.fmin.reduceat(y, starts)
+    maxs = np.fmax.reduceat(y, starts)
+    min_idx = _first_per_segment(np.flatnonzero(y == mins[seg]), seg)
+    max_idx = _first_per_segment(np.flatnonzero(y == maxs[seg]), seg)
+
+    keep = np.unique(np.concatenate(([0, n - 1], min_idx, max_idx)))
+    return x[keep], y[keep]
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling to n_out points.
+
+    Each bucket is reduced with vectorized NumPy; only the walk over buckets
+    (one per output point) runs in Python.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # Bucket i covers samples [edges[i], edges[i + 1]); the first and last
+    # samples are always kept and sit outside the buckets.
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / sizes
+    # The "next bucket" average of the last bucket is the final sample
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[prev] - next_x[i]) * (y[start:end] - y[prev])
+            - (x[prev] - x[start:end]) * (next_y[i] - y[prev])
+        )
+        prev = start + int(np.argmax(area))
+        selected[i + 1] = prev
+    return x[selected], y[selected]
+
+
+def decimate(x, y, width_px, method="minmax"):
+    """Decimates (x, y) for a plot width_px pixels wide using the given method."""
+    if method not in DECIMATION_METHODS:
+        raise ValueError(f"Unknown decimation method '{method}', expected one of {DECIMATION_METHODS}")
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if method == "none":
+        return x, y
+
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+
+    if method == "minmax":
+        return minmax_decimate(x, y, int(width_px))
+    # LTTB keeps one point per bucket; use two per pixel column to match
+    # the density of the min-max output
+    return lttb(x, y, 2 * int(width_px))
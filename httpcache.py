@@ -0,0 +1,140 @@
+import os
+import re
+import hashlib
+import mimetypes
+from email.utils import formatdate
+from fastapi import Request
+from fastapi.responses import Response, FileResponse
+
+# Conditional (ETag / If-None-Match) and partial (Range) responses for
+# generated content, shared by the services that serve data or plots.
+
+# Files whose name is derived from their content never change once written
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Everything else may be cached but must be revalidated (cheap 304s via the ETag)
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts):
+    """Returns a strong ETag computed from bytes/str parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag):
+    """True if the request's If-None-Match already names this ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def parse_range(range_header, size):
+    """Parses a single 'bytes=start-end' range. Returns (start, end) inclusive,
+    None when the header is absent or not a single byte range, or "invalid"
+    when the range cannot be satisfied."""
+    if not range_header:
+        return None
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header)
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+    if start >= size or start > end:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+def cached_response(request: Request, body: bytes, media_type, etag=None, headers=None):
+    """Builds a 200/206/304/416 response for an in-memory body."""
+    etag = etag or make_etag(body)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", **(headers or {})}
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    # If-Range: only honour Range when the client's copy is still current
+    if_range = request.headers.get("if-range")
+    byte_range = parse_range(request.headers.get("range"), len(body))
+    if if_range and if_range.strip() != etag:
+        byte_range = None
+
+    if byte_range == "invalid":
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(body)}"})
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+        return Response(content=body[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def resolve_file(root, filename):
+    """Resolves a client-supplied filename under root. Returns the real path,
+    or None if it escapes root, names a hidden file or is not a regular file."""
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, filename))
+    if not path.startswith(root + os.sep):
+        return None
+    if any(part.startswith(".") for part in os.path.relpath(path, root).split(os.sep)):
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def file_response(request: Request, path, media_type=None, immutable=False, content_named=False, headers=None):
+    """Builds a 200/206/304/416 response for a file on disk.
+
+    The strong ETag comes from the file name, size and modification time, so
+    the file is never read just to validate a cached copy.
+
+    content_named=True is for files whose name determines their content (the
+    plot store): the ETag comes from name and size only, since the store bumps
+    mtimes on every hit to track LRU order. immutable=True additionally lets
+    clients keep the file without revalidating; it implies content_named.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    if immutable or content_named:
+        etag = make_etag(os.path.basename(path), size)
+    else:
+        etag = make_etag(os.path.basename(path), size, stat.st_mtime_ns)
+    media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        **(headers or {}),
+    }
+    if not (immutable or content_named):
+        headers["Last-Modified"] = formatdate(stat.st_mtime, usegmt=True)
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if_range = request.headers.get("if-range")
+    byte_range = parse_range(request.headers.get("range"), size)
+    if if_range and if_range.strip() != etag:
+        byte_range = None
+
+    if byte_range == "invalid":
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range:
+        start, end = byte_range
+        with open(path, "rb") as f:
+            f.seek(start)
+            body = f.read(end - start + 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(content=body, status_code=206, media_type=media_type, headers=headers)
+    # Full responses stream from disk
+    response = FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
+    if "Last-Modified" not in headers:
+        # FileResponse fills it in from the (LRU-bumped) mtime
+        del response.headers["last-modified"]
+    return response
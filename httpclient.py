@@ -0,0 +1,66 @@
+import os
+import asyncio
+import httpx
+
+# Shared async HTTP client for the backend services. One pooled client per
+# process keeps connections to TJ-II (and the local servlets) alive between
+# requests instead of opening a new TLS session for every fetch.
+HTTP_TIMEOUT = httpx.Timeout(
+    float(os.getenv("HTTP_READ_TIMEOUT", "30")),
+    connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+)
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "10")),
+    keepalive_expiry=30,
+)
+
+_client = None
+
+
+def get_client():
+    """Returns the process-wide AsyncClient, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        # info.fusion.ciemat.es is queried with verify=False, as before
+        transport = httpx.AsyncHTTPTransport(verify=False, limits=HTTP_LIMITS, retries=1)
+        _client = httpx.AsyncClient(transport=transport, timeout=HTTP_TIMEOUT)
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+async def get_text(url, params=None, retries=HTTP_RETRIES, timeout=None):
+    """GETs a URL and returns the body text, or None if the status is not 200.
+
+    Timeouts, connection errors and 5xx responses are retried with exponential
+    backoff; the last transport error is re-raised once retries run out.
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = await get_client().get(url, params=params, timeout=timeout or HTTP_TIMEOUT)
+            if response.status_code < 500 or attempt == retries:
+                return response.text if response.status_code == 200 else None
+            print(f"⚠️ {url} returned {response.status_code}, retrying ({attempt + 1}/{retries})")
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise
+            print(f"⚠️ {type(e).__name__} fetching {url}, retrying ({attempt + 1}/{retries})")
+        await asyncio.sleep(0.5 * 2 ** attempt)
+
+
+async def iter_text(url, params=None, timeout=None):
+    """Streams the body of a GET as text chunks, so callers can parse while
+    the response downloads. Raises httpx.HTTPStatusError unless the status is 200."""
+    async with get_client().stream("GET", url, params=params, timeout=timeout or HTTP_TIMEOUT) as response:
+        if response.status_code != 200:
+            raise httpx.HTTPStatusError(f"Unexpected status {response.status_code}",
+                                        request=response.request, response=response)
+        async for chunk in response.aiter_text():
+            yield chunk
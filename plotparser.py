@@ -0,0 +1,131 @@
+import re
+
+# Deterministic parser for plot requests such as
+#   "Plot ECE10 and Densidad2_ for shot 57547 from 0 to 2000"
+# It returns the same structure the LLM parser produces, or None when the
+# request is incomplete or ambiguous so the caller can fall back to the LLM.
+SIGNAL_OPTIONS_FILE = "signal_options.txt"
+
+NUMBER = r"-?\d+(?:[.,]\d+)?"
+SHOT_KEYWORDS = r"(?:shot|shots|discharge|descarga|disparo|pulse|n[ºo°]\.?)"
+EXPLICIT_SHOT_PATTERN = re.compile(rf"\b{SHOT_KEYWORDS}\s*(?:number|n[ºo°]|#)?\s*[:#]?\s*(\d{{4,6}})\b", re.IGNORECASE)
+BARE_SHOT_PATTERN = re.compile(r"(?<![\w.,-])(\d{5})(?![\w.,])")
+RANGE_PATTERNS = [
+    # from 0 to 2000 / between 100 and 200 ms / desde 0 hasta 2000
+    re.compile(rf"\b(?:from|between|desde|entre|de)\s+({NUMBER})\s*(?:ms|s)?\s*(?:to|and|until|till|-|a|y|hasta)\s+({NUMBER})", re.IGNORECASE),
+    # tstart=100 tstop=200
+    re.compile(rf"\btstart\s*[=:]\s*({NUMBER}).*?\btstop\s*[=:]\s*({NUMBER})", re.IGNORECASE),
+    # [100, 200] / (100 - 200)
+    re.compile(rf"[\[(]\s*({NUMBER})\s*[,;-]\s*({NUMBER})\s*[\])]"),
+    # 100-200 ms / 100 to 200 ms
+    re.compile(rf"(?<![\w.])({NUMBER})\s*(?:-|–|to)\s*({NUMBER})\s*ms\b", re.IGNORECASE),
+]
+TOKEN_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+# Any number that is not part of a signal name such as ECE10
+LOOSE_NUMBER_PATTERN = re.compile(r"(?<![\w.,])\d+(?:[.,]\d+)?(?!\w)")
+
+
+def load_signal_names(file_path=SIGNAL_OPTIONS_FILE):
+    with open(file_path, "r", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def build_signal_lookup(signal_names):
+    """Maps lower-cased names to the signals that spell that way."""
+    lookup = {}
+    for name in signal_names:
+        lookup.setdefault(name.lower(), []).append(name)
+    return lookup
+
+
+def _to_float(value):
+    return float(value.replace(",", "."))
+
+
+def _find_range(text):
+    """Returns (time_range, spans); time_range is (tstart, tstop), None or "ambiguous"."""
+    found, spans = set(), []
+    for pattern in RANGE_PATTERNS:
+        for match in pattern.finditer(text):
+            found.add((_to_float(match.group(1)), _to_float(match.group(2))))
+            spans.append(match.span())
+    if not found:
+        return None, spans
+    if len(found) > 1:
+        return "ambiguous", spans
+    tstart, tstop = found.pop()
+    if tstart >= tstop:
+        return "ambiguous", spans
+    return (tstart, tstop), spans
+
+
+def _find_signals(text, signal_names, lookup):
+    exact = set(signal_names)
+    signals, ambiguous = [], False
+    for token in TOKEN_PATTERN.findall(text):
+        if token in exact:
+            candidates = [token]
+        elif any(ch.isdigit() or ch == "_" for ch in token) or token.isupper():
+            # Case-insensitive and missing-trailing-underscore forms, but only
+            # for tokens that look like signal names rather than plain words
+            candidates = lookup.get(token.lower(), []) + lookup.get(token.lower() + "_", [])
+        else:
+            candidates = []
+        if len(candidates) > 1:
+            ambiguous = True
+        elif candidates and candidates[0] not in signals:
+            signals.append(candidates[0])
+    return signals, ambiguous
+
+
+def _blank(text, spans):
+    chars = list(text)
+    for start, end in spans:
+        chars[start:end] = " " * (end - start)
+    return "".join(chars)
+
+
+def parse_plot_request(text, signal_names, lookup=None):
+    """Parses shot, time range and signals from a plot request.
+
+    Returns {"shot", "tstart", "tstop", "signals"} when every field is
+    unambiguous, otherwise None. Any number left over once the shot and the
+    time range are accounted for (a second shot, an open bound such as "up to
+    500 ms") also makes the request ambiguous.
+
+    >>> names = ["ECE10", "Densidad2_", "TFI"]
+    >>> parse_plot_request("Plot ECE10 and Densidad2_ for shot 57547 from 0 to 2000", names)
+    {'shot': 57547, 'tstart': 0.0, 'tstop': 2000.0, 'signals': ['ECE10', 'Densidad2_']}
+    >>> parse_plot_request("Plot ECE10 for shots 57547 and 57548", names) is None
+    True
+    >>> parse_plot_request("Compare ECE10 and TFI in shot 57547 vs 57550", names) is None
+    True
+    >>> parse_plot_request("Plot ECE10 for shot 57547 up to 500 ms", names) is None
+    True
+    >>> parse_plot_request("Plot the first 300 ms of ECE10 for shot 57547", names) is None
+    True
+    """
+    lookup = lookup or build_signal_lookup(signal_names)
+
+    time_range, range_spans = _find_range(text)
+    if time_range == "ambiguous":
+        return None
+
+    # Numbers that belong to the time range are not shot candidates
+    remaining = _blank(text, range_spans)
+
+    shot_matches = list(EXPLICIT_SHOT_PATTERN.finditer(remaining))
+    if not shot_matches:
+        shot_matches = list(BARE_SHOT_PATTERN.finditer(remaining))
+    shots = {int(m.group(1)) for m in shot_matches}
+    if len(shots) != 1:
+        return None
+    if LOOSE_NUMBER_PATTERN.search(_blank(remaining, [m.span(1) for m in shot_matches])):
+        return None
+
+    signals, ambiguous = _find_signals(remaining, signal_names, lookup)
+    if ambiguous or not signals:
+        return None
+
+    tstart, tstop = time_range if time_range else (None, None)
+    return {"shot": shots.pop(), "tstart": tstart, "tstop": tstop, "signals": signals}
@@ -0,0 +1,93 @@
+import os
+import asyncio
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+
+# Plot rendering on a process pool shared by the plotting services.
+#
+# pyplot's global state machine is not thread-safe and rendering is CPU-bound,
+# so request handlers never draw themselves: they describe the figure as a
+# plain "plot spec" and await render(spec), which runs in a worker process
+# using the object-oriented Figure API on the Agg backend.
+#
+# Plot spec:
+#   {
+#       "figsize": (10, 6), "dpi": 100, "format": "png",
+#       "nrows": 1, "ncols": 1, "sharex": False, "suptitle": None,
+#       "axes": [{
+#           "title": "...", "xlabel": "...", "ylabel": "...",
+#           "legend": True, "grid": False,
+#           "series": [{"x": array, "y": array, "label": "...", "linewidth": 1.5}],
+#       }],
+#   }
+PLOT_WORKERS = int(os.getenv("PLOT_WORKERS", "0")) or os.cpu_count() or 1
+
+_pool = None
+
+
+def _init_worker():
+    # Preload the Agg backend once per worker instead of once per plot
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.figure  # noqa: F401
+    import matplotlib.backends.backend_agg  # noqa: F401
+
+
+def render_figure(spec):
+    """Renders a plot spec and returns the encoded image bytes."""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=spec.get("figsize", (10, 6)), dpi=spec.get("dpi", 100))
+    axes_specs = spec.get("axes", [])
+    nrows = spec.get("nrows", max(len(axes_specs), 1))
+    ncols = spec.get("ncols", 1)
+    axes = fig.subplots(nrows, ncols, squeeze=False, sharex=spec.get("sharex", False)).ravel()
+
+    for ax, ax_spec in zip(axes, axes_specs):
+        for series in ax_spec.get("series", []):
+            ax.plot(series["x"], series["y"], label=series.get("label"),
+                    linewidth=series.get("linewidth", 1.5))
+        ax.set_title(ax_spec.get("title", ""))
+        ax.set_xlabel(ax_spec.get("xlabel", ""))
+        ax.set_ylabel(ax_spec.get("ylabel", ""))
+        if ax_spec.get("legend", True) and any(s.get("label") for s in ax_spec.get("series", [])):
+            ax.legend()
+        if ax_spec.get("grid"):
+            ax.grid()
+    for ax in axes[len(axes_specs):]:
+        ax.set_visible(False)
+
+    if spec.get("suptitle"):
+        fig.suptitle(spec["suptitle"])
+    if len(axes_specs) > 1:
+        fig.tight_layout()
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format=spec.get("format", "png"))
+    return buffer.getvalue()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: forking a server process that already runs threads is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=PLOT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _pool
+
+
+async def render(spec):
+    """Renders a plot spec on the worker pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), render_figure, spec)
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
@@ -0,0 +1,168 @@
+import os
+import glob
+import json
+import hashlib
+import argparse
+import threading
+
+# Content-keyed store for rendered plots. A plot's file name is a hash of
+# everything that determines its pixels (shot, signals, time range, render
+# options), so identical requests map to the same file and can be served
+# without fetching or rendering anything. Least recently used files are
+# evicted once the store grows beyond its disk budget, except plots that a
+# saved session still points to: every plot_path in the context history files
+# (which reports are generated from) is kept, and so is every file of a
+# plot_key they list (all render tiers of that plot and its inputs).
+PLOT_STORE_DIR = os.getenv("PLOT_STORE_DIR", os.path.join("static", "plots"))
+PLOT_STORE_BUDGET_MB = float(os.getenv("PLOT_STORE_BUDGET_MB", "500"))
+PLOT_REFERENCE_FILES = os.getenv("PLOT_REFERENCE_FILES", os.path.join("context", "*_history.json"))
+os.makedirs(PLOT_STORE_DIR, exist_ok=True)
+
+_evict_lock = threading.Lock()
+_references = {}
+
+
+def plot_key(params):
+    """Returns a stable hash for a dict of plot inputs."""
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def plot_path(key, ext="png"):
+    return os.path.join(PLOT_STORE_DIR, f"plot_{key}.{ext}")
+
+
+def get_plot(key, ext="png"):
+    """Returns the stored file path for key, or None. A hit counts as a use for LRU."""
+    path = plot_path(key, ext)
+    try:
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+
+def put_plot(key, data, ext="png"):
+    """Stores rendered bytes under key and returns the file path."""
+    path = plot_path(key, ext)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    evict()
+    return path
+
+
+def put_spec(key, params):
+    """Stores the inputs a plot was made from, so other tiers can be rendered later."""
+    path = os.path.join(PLOT_STORE_DIR, f"plot_{key}.json")
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(params, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def get_spec(key):
+    """Returns the inputs stored by put_spec, or None."""
+    path = os.path.join(PLOT_STORE_DIR, f"plot_{key}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            params = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return params
+
+
+def references():
+    """(absolute plot paths, plot keys) referenced by the context history files."""
+    paths, keys = set(), set()
+    for history_file in glob.glob(PLOT_REFERENCE_FILES):
+        try:
+            mtime = os.path.getmtime(history_file)
+        except OSError:
+            continue
+        cached = _references.get(history_file)
+        if cached is None or cached[0] != mtime:
+            try:
+                with open(history_file, "r", encoding="utf-8") as f:
+                    history = json.load(f)
+                entries = [entry for entry in history if isinstance(entry, dict)]
+                refs = ({os.path.abspath(entry["plot_path"]) for entry in entries if entry.get("plot_path")},
+                        {entry["plot_key"] for entry in entries if entry.get("plot_key")})
+            except (OSError, ValueError, TypeError) as e:
+                # Keep what we knew rather than treating the plots as unreferenced
+                print(f"⚠️ Could not read plot references from {history_file}: {e}")
+                refs = cached[1] if cached else (set(), set())
+            cached = (mtime, refs)
+            _references[history_file] = cached
+        paths |= cached[1][0]
+        keys |= cached[1][1]
+    return paths, keys
+
+
+def _is_referenced(path, refs):
+    paths, keys = refs
+    if os.path.abspath(path) in paths:
+        return True
+    # plot_<key>.json, plot_<key>-<tier>.<ext>
+    name = os.path.basename(path)[len("plot_"):]
+    return name.split(".", 1)[0].split("-", 1)[0] in keys
+
+
+def evict(budget_bytes=None):
+    """Deletes least recently used, unreferenced plots until the store fits in its budget."""
+    budget_bytes = PLOT_STORE_BUDGET_MB * 1024 * 1024 if budget_bytes is None else budget_bytes
+    with _evict_lock:
+        entries = []
+        for entry in os.scandir(PLOT_STORE_DIR):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        if total <= budget_bytes:
+            return
+
+        refs = references()
+        for _, size, path in sorted(entries):
+            if _is_referenced(path, refs):
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                print(f"🧹 Evicted cached plot {os.path.basename(path)}")
+            except OSError:
+                continue
+            if total <= budget_bytes:
+                break
+        else:
+            print(f"⚠️ Plot store holds {total / 1024 / 1024:.0f} MB of referenced plots, over its budget")
+
+
+def sweep_legacy(directory="static", pattern="plot_*.png"):
+    """Deletes unreferenced plots written before the store existed (e.g. the
+    per-request static/plot_<signal>_<shot>_<id>.png files). Returns the count."""
+    refs = references()
+    removed = 0
+    for path in glob.glob(os.path.join(directory, pattern)):
+        if _is_referenced(path, refs):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            continue
+    print(f"🧹 Removed {removed} unreferenced legacy plots from {directory}")
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Garbage-collect the plot store")
+    parser.add_argument("--budget-mb", type=float, default=PLOT_STORE_BUDGET_MB)
+    parser.add_argument("--sweep-legacy", metavar="DIR", help="also delete unreferenced plot_*.png files in DIR")
+    args = parser.parse_args()
+
+    evict(args.budget_mb * 1024 * 1024)
+    if args.sweep_legacy:
+        sweep_legacy(args.sweep_legacy)
@@ -0,0 +1,52 @@
+import os
+import json
+import hashlib
+import threading
+
+# Cache of LLM-written report sections, one per context history entry. A
+# section is keyed on the tool, the entry's full content and the prompt/model
+# it was written with, so regenerating a report only sends new or edited
+# entries to the model; everything else is assembled from this cache.
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join("cache", "report_sections"))
+os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+
+
+def section_key(tool, entry, prompt_version, model_name):
+    canonical = json.dumps({"tool": tool, "entry": entry, "prompt": prompt_version, "model": model_name},
+                           sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def _section_path(key):
+    return os.path.join(REPORT_CACHE_DIR, f"{key}.json")
+
+
+def get_section(key):
+    """Returns the cached section text for key, or None."""
+    path = _section_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["text"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Ignoring unreadable report section {path}: {e}")
+        return None
+
+
+def put_section(key, text):
+    path = _section_path(key)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"text": text}, f)
+    os.replace(tmp_path, path)
+
+
+def clear():
+    """Drops every cached section, e.g. after changing the report prompt."""
+    for filename in os.listdir(REPORT_CACHE_DIR):
+        if filename.endswith(".json"):
+            try:
+                os.remove(os.path.join(REPORT_CACHE_DIR, filename))
+            except OSError:
+                pass
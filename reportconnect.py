@@ -1,25 +1,21 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
-import os, json, textwrap
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-from docx import Document
-from docx.shared import Pt, Inches
+import os, json
 from dotenv import load_dotenv
 import google.generativeai as genai
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import Image
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
-import re
+import uuid
+import time
+import hashlib
+import asyncio
+import threading
+import httpcache
+import reportcache
+import reportdoc
+from concurrent.futures import ThreadPoolExecutor
+import plotstore
+import httpx
 
 # Configuración inicial
 load_dotenv()
@@ -33,156 +29,156 @@ CONTEXT_DIR = "context"
 STATIC_DIR = "static"
 os.makedirs(CONTEXT_DIR, exist_ok=True)
 os.makedirs(STATIC_DIR, exist_ok=True)
-def is_markdown_table(lines):
-    return (
-        len(lines) >= 2
-        and "|" in lines[0]
-        and "|" in lines[1]
-        and set(lines[1].strip()) <= set("|- ")
-    )
-@app.get("/generate_report")
-def generate_report():
-    files = {
-        "SimilPatternTool": "similpattern_history.json",
-        "ShotLlama2": "shotllama2_history.json",
-        "CsvUpdate": "csvupdate_history.json"
-    }
+# Context history files the report is built from, in report order
+REPORT_SOURCES = {
+    "SimilPatternTool": "similpattern_history.json",
+    "ShotLlama2": "shotllama2_history.json",
+    "CsvUpdate": "csvupdate_history.json"
+}
+# Bump when the section prompt changes, so cached sections are rewritten
+REPORT_PROMPT_VERSION = 1
+# Concurrent Gemini calls when several entries need a new section
+REPORT_LLM_WORKERS = int(os.getenv("REPORT_LLM_WORKERS", "4"))
+# Similarity plots are embedded at the full tier (PNG: python-docx and reportlab
+# can't embed SVG), rendered by the SimilPattern service when not stored yet
+SIMILPATTERN_SERVICE_URL = os.getenv("SIMILPATTERN_SERVICE_URL", "http://localhost:5004")
+REPORT_PLOT_TIER = "full"
+REPORT_PLOT_TIMEOUT = float(os.getenv("REPORT_PLOT_TIMEOUT", "120"))
 
-    sections = []
-    for section, file in files.items():
+def load_history():
+    """Returns [(tool, entries)] for every non-empty context history file."""
+    history = []
+    for section, file in REPORT_SOURCES.items():
         path = os.path.join(CONTEXT_DIR, file)
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
                 entries = json.load(f)
-                if entries:
-                    summary = f"### {section}\n"
-                    for entry in entries:
-                        summary += f"**Query:** {entry.get('question', '')}\n"
-                        if "pattern_summary" in entry:
-                            summary += f"**Pattern Summary:**\n{entry['pattern_summary']}\n"
-                        if "response" in entry:
-                            summary += f"**Results:**\n{entry['response']}\n"
-                        if "plot_path" in entry:
-                            summary += f"**Plot:** {entry['plot_path']}\n"
-                        summary += "\n"
-                    sections.append(summary)
-
-    if not sections:
-        return JSONResponse({"message": "No context to generate report."}, status_code=200)
+            if entries:
+                history.append((section, entries))
+    return history
 
-    report_text = "# Plasma Fusion Tools Report\n\n" + "\n".join(sections)
+def format_entry(entry):
+    """Raw text of one history entry, as given to the model."""
+    summary = f"**Query:** {entry.get('question', '')}\n"
+    if "pattern_summary" in entry:
+        summary += f"**Pattern Summary:**\n{entry['pattern_summary']}\n"
+    if "response" in entry:
+        summary += f"**Results:**\n{entry['response']}\n"
+    return summary
 
-    prompt = f"""
+def section_prompt(section, entry):
+    return f"""
     You are a scientific assistant generating a clean, structured report based on plasma fusion tools analysis.
+    Write the part of the report for one query made with the {section} tool.
 
-    Generate clear section headers (no #), concise bullet points if useful, and format numerical tables when needed.
+    Use plain text without section headers, concise bullet points if useful, and format numerical tables when needed.
 
-    DO NOT write meta-instructions like "Here's the report".
+    DO NOT write meta-instructions like "Here's the report". Do not write the tool name or a plot line.
 
     Don´t write the similarity pattern info like confidence shot and interval, since it is already being displayed in a graph.
     Do write some small analysis of the results.
-    Structure it like this when possible:
+    Structure it like this when possible, separating the parts with blank lines:
 
-    Tool Name
     Query: ...
     Pattern Summary:
     [Table]
     Results: ...
-    Plot: [keep the relative plot path]
 
     Here is the raw input:
-    {report_text}
+    {format_entry(entry)}
     """
 
-    model = genai.GenerativeModel(MODEL_NAME)
-    response = model.generate_content(prompt)
-    cleaned = response.text.strip()
+def write_section(section, entry):
+    """Asks Gemini for the section of one entry. Returns (text, cacheable)."""
+    try:
+        model = genai.GenerativeModel(MODEL_NAME)
+        return model.generate_content(section_prompt(section, entry)).text.strip(), True
+    except Exception as e:
+        # Still produce the report; the entry is retried on the next one
+        print(f"⚠️ Gemini failed for a {section} entry, using its raw text: {e}")
+        return format_entry(entry).replace("**", "").strip(), False
+
+def full_plot_path(key):
+    """Path of the full-resolution tier of a similarity plot, or None if it
+    can't be had (the entry's own plot is used instead)."""
+    path = plotstore.get_plot(f"{key}-{REPORT_PLOT_TIER}", "png")
+    if path is None:
+        try:
+            # Renders the tier from the stored plot inputs and adds it to the store
+            response = httpx.get(f"{SIMILPATTERN_SERVICE_URL}/similarity_plot/{key}",
+                                 params={"tier": REPORT_PLOT_TIER}, timeout=REPORT_PLOT_TIMEOUT)
+            response.raise_for_status()
+            path = plotstore.get_plot(f"{key}-{REPORT_PLOT_TIER}", "png")
+        except httpx.HTTPError as e:
+            print(f"⚠️ No full-resolution plot for {key}, using the stored one: {e}")
+    return path
+
+def build_report_text(history, progress=None):
+    """Assembles the report text from per-entry sections. Only entries without a
+    cached section go to the model, concurrently and once per distinct entry."""
+    sections = {}
+    missing = {}
+    for section, entries in history:
+        for entry in entries:
+            key = reportcache.section_key(section, entry, REPORT_PROMPT_VERSION, MODEL_NAME)
+            if key not in sections and key not in missing:
+                text = reportcache.get_section(key)
+                if text is None:
+                    missing[key] = (section, entry)
+                else:
+                    sections[key] = text
+
+    print(f"📝 Report: {sum(len(entries) for _, entries in history)} entries, {len(missing)} need a new section")
+    if progress:
+        progress("sections", f"0/{len(missing)}")
+    if missing:
+        with ThreadPoolExecutor(max_workers=REPORT_LLM_WORKERS) as executor:
+            written = executor.map(lambda job: write_section(*job), missing.values())
+            for done, (key, (text, cacheable)) in enumerate(zip(missing, written), 1):
+                sections[key] = text
+                if cacheable:
+                    reportcache.put_section(key, text)
+                if progress:
+                    progress("sections", f"{done}/{len(missing)}")
+
+    plot_keys = {entry["plot_key"] for _, entries in history for entry in entries if entry.get("plot_key")}
+    with ThreadPoolExecutor(max_workers=REPORT_LLM_WORKERS) as executor:
+        full_plots = dict(zip(plot_keys, executor.map(full_plot_path, plot_keys)))
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    blocks = []
+    for section, entries in history:
+        blocks.append(section)
+        for entry in entries:
+            blocks.append(sections[reportcache.section_key(section, entry, REPORT_PROMPT_VERSION, MODEL_NAME)])
+            plot_path = full_plots.get(entry.get("plot_key")) or entry.get("plot_path")
+            if plot_path:
+                blocks.append(f"Plot: {plot_path}")
+    return "\n\n".join(blocks)
+
+@app.get("/generate_report")
+def generate_report():
+    history = load_history()
+    if not history:
+        return JSONResponse({"message": "No context to generate report."}, status_code=200)
+    return build_report(history)
+
+def build_report(history, progress=None):
+    """Writes the DOCX and PDF reports for history and returns their URLs.
+    progress(stage, detail) is called as the work advances."""
+    progress = progress or (lambda stage, detail=None: None)
+    cleaned = build_report_text(history, progress)
+
+    # Concurrent jobs may finish within the same second
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S") + f"_{uuid.uuid4().hex[:6]}"
     pdf_filename = f"report_{timestamp}.pdf"
     docx_filename = f"report_{timestamp}.docx"
     pdf_path = os.path.join(STATIC_DIR, pdf_filename)
     docx_path = os.path.join(STATIC_DIR, docx_filename)
 
-    # ➤ DOCX
-    doc = Document()
-    doc.add_heading("Fusion Data Analysis Report", 0)
-
-    for block in cleaned.split("\n\n"):
-        lines = block.strip().split("\n")
-        if not lines:
-            continue
-
-        if lines[0].lower().startswith("plot:"):
-            plot_path = lines[0].split(":", 1)[1].strip()
-            full_path = os.path.join(plot_path)
-            if os.path.exists(full_path):
-                doc.add_picture(full_path, width=Inches(5.5))
-        elif is_markdown_table(lines):
-            # Parse markdown table to 2D list
-            table_data = [
-                [cell.strip() for cell in row.strip("|").split("|")]
-                for row in lines
-                if not re.match(r"^\s*\|?\s*-+\s*\|", row)  # Skip separator line
-            ]
-            table = doc.add_table(rows=0, cols=len(table_data[0]))
-            table.style = 'Table Grid'
-
-            for row_data in table_data:
-                row = table.add_row().cells
-                for idx, cell in enumerate(row_data):
-                    row[idx].text = cell
-        else:
-            for line in lines:
-                if not line.lower().startswith("query:"):
-                    doc.add_paragraph(line.strip(), style='Normal')
-
-    doc.save(docx_path)
-
-    # ➤ PDF
-    pdf_doc = SimpleDocTemplate(pdf_path, pagesize=letter, rightMargin=40, leftMargin=40, topMargin=40, bottomMargin=40)
-    styles = getSampleStyleSheet()
-    story = []
-
-    for block in cleaned.split("\n\n"):
-        lines = block.strip().split("\n")
-        if not lines:
-            continue
-
-        if lines[0].lower().startswith("plot:"):
-            plot_path = lines[0].split(":", 1)[1].strip()
-            full_path = os.path.join(plot_path)
-            if os.path.exists(full_path):
-                story.append(Spacer(1, 12))
-                img = Image(full_path, width=500, height=200)
-                story.append(img)
-                story.append(Spacer(1, 24))
-        elif all(line.strip().startswith("|") and line.strip().endswith("|") for line in lines):
-            # Table detected
-            data = [
-                line.strip("|").split("|")
-                for line in lines
-                if not all(cell.strip("- ") == "" for cell in line.strip("|").split("|"))  # descarta fila separadora
-            ]
-            table = Table(data)
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4B72B0")),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
-            ]))
-            story.append(table)
-            story.append(Spacer(1, 16))
-        else:
-            for line in lines:
-                if not line.lower().startswith("query:"):
-                    story.append(Paragraph(line.strip(), styles["Normal"]))
-            story.append(Spacer(1, 12))
-
-    pdf_doc.build(story)
+    # Parse once, then write both formats in parallel worker processes
+    blocks = reportdoc.parse_report(cleaned, headings=REPORT_SOURCES.keys())
+    progress("render")
+    reportdoc.render_all(blocks, docx_path, pdf_path)
 
     print("✅ Returning report URLs:")
     print(f"PDF: http://localhost:5005/static/{pdf_filename}")
@@ -193,6 +189,103 @@ def generate_report():
         "word_url": f"http://localhost:5005/static/{docx_filename}"
     }
 
+# Background report jobs: POST /report_jobs returns at once, the report is
+# built on a bounded worker pool, and clients poll GET /report_jobs/{id} or
+# follow GET /report_jobs/{id}/events (server-sent events). A submission
+# whose history is identical to a queued or running job joins that job.
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+REPORT_JOB_HISTORY = 100  # finished jobs kept for polling
+ACTIVE_JOB_STATES = ("queued", "running")
+
+report_executor = ThreadPoolExecutor(max_workers=REPORT_JOB_WORKERS)
+report_jobs = {}
+report_jobs_lock = threading.Lock()
+
+def job_status(job):
+    return {key: job[key] for key in ("id", "state", "stage", "detail", "result", "error", "created_at", "finished_at")}
+
+def update_job(job, **changes):
+    with report_jobs_lock:
+        job.update(changes)
+        job["events"].append(job_status(job))
+
+def run_report_job(job, history):
+    update_job(job, state="running", stage="started", detail=None)
+    try:
+        result = build_report(history, lambda stage, detail=None: update_job(job, stage=stage, detail=detail))
+        update_job(job, state="done", stage="done", detail=None, result=result, finished_at=time.time())
+    except Exception as e:
+        print(f"❌ Report job {job['id']} failed: {e}")
+        update_job(job, state="failed", stage="failed", error=str(e), finished_at=time.time())
+
+def prune_report_jobs():
+    finished = sorted((job for job in report_jobs.values() if job["state"] not in ACTIVE_JOB_STATES),
+                      key=lambda job: job["finished_at"])
+    for job in finished[:max(len(finished) - REPORT_JOB_HISTORY, 0)]:
+        del report_jobs[job["id"]]
+
+@app.post("/report_jobs", status_code=202)
+def submit_report_job():
+    history = load_history()
+    if not history:
+        return JSONResponse({"message": "No context to generate report."}, status_code=200)
+    fingerprint = hashlib.sha256(json.dumps(history, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    with report_jobs_lock:
+        job = next((job for job in report_jobs.values()
+                    if job["fingerprint"] == fingerprint and job["state"] in ACTIVE_JOB_STATES), None)
+        deduplicated = job is not None
+        if job is None:
+            prune_report_jobs()
+            job_id = uuid.uuid4().hex
+            job = {"id": job_id, "state": "queued", "stage": "queued", "detail": None, "result": None,
+                   "error": None, "created_at": time.time(), "finished_at": None,
+                   "fingerprint": fingerprint, "events": []}
+            job["events"].append(job_status(job))
+            report_jobs[job_id] = job
+            report_executor.submit(run_report_job, job, history)
+
+    return {**job_status(job), "job_id": job["id"], "deduplicated": deduplicated,
+            "status_url": f"http://localhost:5005/report_jobs/{job['id']}",
+            "events_url": f"http://localhost:5005/report_jobs/{job['id']}/events"}
+
+def get_report_job(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
+
+@app.get("/report_jobs/{job_id}")
+def report_job_status(job_id: str):
+    job = get_report_job(job_id)
+    with report_jobs_lock:
+        return job_status(job)
+
+@app.get("/report_jobs/{job_id}/events")
+async def report_job_events(job_id: str):
+    job = get_report_job(job_id)
+
+    async def stream():
+        sent = 0
+        while True:
+            with report_jobs_lock:
+                events = job["events"][sent:]
+                finished = job["state"] not in ACTIVE_JOB_STATES
+            for event in events:
+                yield f"event: {event['state']}\ndata: {json.dumps(event)}\n\n"
+            sent += len(events)
+            if finished:
+                return
+            await asyncio.sleep(0.25)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.on_event("shutdown")
+def on_shutdown():
+    report_executor.shutdown(wait=False, cancel_futures=True)
+    reportdoc.shutdown_pool()
+
 @app.post("/reset_context")
 def reset_context():
     deleted = []
@@ -203,4 +296,11 @@ def reset_context():
             deleted.append(file)
     return {"message": f"Deleted: {deleted}"}
 
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
\ No newline at end of file
+@app.get("/static/{filename:path}")
+async def serve_static(request: Request, filename: str):
+    # Reports and plots with ETag/Range support; plot store names are content hashes
+    file_path = httpcache.resolve_file(STATIC_DIR, filename)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    immutable = os.path.dirname(file_path) == os.path.realpath(plotstore.PLOT_STORE_DIR)
+    return httpcache.file_response(request, file_path, immutable=immutable)
\ No newline at end of file
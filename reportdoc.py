@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Report document model. The report text is parsed once into a list of
+# blocks, plain dicts so they can be sent to worker processes:
+#
+#   {"type": "heading", "text": "..."}
+#   {"type": "paragraphs", "lines": ["...", ...]}
+#   {"type": "table", "rows": [["cell", ...], ...]}    first row is the header
+#   {"type": "image", "path": "static/plots/..."}
+#
+# render_docx() and render_pdf() turn the same model into python-docx and
+# reportlab output; render_all() runs both at once in separate processes.
+REPORT_TITLE = "Fusion Data Analysis Report"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def is_markdown_table(lines):
+    return (
+        len(lines) >= 2
+        and "|" in lines[0]
+        and "|" in lines[1]
+        and set(lines[1].strip()) <= set("|- ")
+    )
+
+
+def _is_table(lines):
+    return is_markdown_table(lines) or all(
+        line.strip().startswith("|") and line.strip().endswith("|") for line in lines
+    )
+
+
+def _table_rows(lines):
+    rows = [
+        [cell.strip() for cell in line.strip().strip("|").split("|")]
+        for line in lines
+        if not re.fullmatch(r"[\s|:-]*", line)  # Skip separator line
+    ]
+    # python-docx and reportlab both need rectangular tables
+    width = max(len(row) for row in rows)
+    return [row + [""] * (width - len(row)) for row in rows]
+
+
+def parse_report(text, headings=()):
+    """Parses report text into the block model. Blocks are separated by blank
+    lines; single-line blocks listed in headings become headings."""
+    blocks = []
+    for block in text.split("\n\n"):
+        lines = [line for line in block.strip().split("\n") if line.strip()]
+        if not lines:
+            continue
+
+        if lines[0].lower().startswith("plot:"):
+            plot_path = lines[0].split(":", 1)[1].strip()
+            if os.path.exists(plot_path):
+                blocks.append({"type": "image", "path": plot_path})
+        elif len(lines) == 1 and lines[0].strip() in headings:
+            blocks.append({"type": "heading", "text": lines[0].strip()})
+        elif _is_table(lines):
+            rows = _table_rows(lines)
+            if rows:
+                blocks.append({"type": "table", "rows": rows})
+        else:
+            paragraphs = [line.strip() for line in lines if not line.lower().startswith("query:")]
+            if paragraphs:
+                blocks.append({"type": "paragraphs", "lines": paragraphs})
+    return blocks
+
+
+def render_docx(blocks, path):
+    from docx import Document
+    from docx.shared import Inches
+
+    doc = Document()
+    doc.add_heading(REPORT_TITLE, 0)
+    for block in blocks:
+        if block["type"] == "heading":
+            doc.add_heading(block["text"], level=1)
+        elif block["type"] == "image":
+            doc.add_picture(block["path"], width=Inches(5.5))
+        elif block["type"] == "table":
+            table = doc.add_table(rows=0, cols=len(block["rows"][0]))
+            table.style = 'Table Grid'
+            for row_data in block["rows"]:
+                row = table.add_row().cells
+                for idx, cell in enumerate(row_data):
+                    row[idx].text = cell
+        else:
+            for line in block["lines"]:
+                doc.add_paragraph(line, style='Normal')
+    doc.save(path)
+    return path
+
+
+def render_pdf(blocks, path):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+
+    pdf_doc = SimpleDocTemplate(path, pagesize=letter, rightMargin=40, leftMargin=40, topMargin=40, bottomMargin=40)
+    styles = getSampleStyleSheet()
+    story = [Paragraph(REPORT_TITLE, styles["Title"])]
+
+    for block in blocks:
+        if block["type"] == "heading":
+            story.append(Paragraph(block["text"], styles["Heading2"]))
+        elif block["type"] == "image":
+            story.append(Spacer(1, 12))
+            story.append(Image(block["path"], width=500, height=200))
+            story.append(Spacer(1, 24))
+        elif block["type"] == "table":
+            table = Table(block["rows"])
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4B72B0")),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 0), (-1, -1), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
+            ]))
+            story.append(table)
+            story.append(Spacer(1, 16))
+        else:
+            for line in block["lines"]:
+                story.append(Paragraph(line, styles["Normal"]))
+            story.append(Spacer(1, 12))
+
+    pdf_doc.build(story)
+    return path
+
+
+def get_pool():
+    global _pool
+    # Report jobs run in threads, so two of them may ask for the pool at once
+    with _pool_lock:
+        if _pool is None:
+            # spawn, like the plot pool: the server process already runs threads
+            _pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def render_all(blocks, docx_path, pdf_path):
+    """Renders the DOCX and PDF concurrently in worker processes; returns both paths."""
+    docx_future = get_pool().submit(render_docx, blocks, docx_path)
+    pdf_future = get_pool().submit(render_pdf, blocks, pdf_path)
+    return docx_future.result(), pdf_future.result()
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -1,23 +1,36 @@
 import os
 import json
 import re
-import requests
-import matplotlib.pyplot as plt
+import math
+import struct
+import asyncio
+import httpx
+import numpy as np
 from io import BytesIO
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from langchain_community.llms import Replicate
-import matplotlib
 import json
 import os
+import signalcache
+import httpclient
+import decimation
+import httpcache
+import plotrender
+import plotparser
+import plotstore
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional; raw float32 always works
+    pa = None
 
 CONTEXT_DIR = "context"
 os.makedirs(CONTEXT_DIR, exist_ok=True)
 
-matplotlib.use('Agg')  # Prevents GUI errors
-
 # Load environment variables
 load_dotenv()
 os.environ["REPLICATE_API_TOKEN"] = os.getenv("REPLICATE_API_TOKEN")
@@ -40,7 +53,25 @@ llm = Replicate(
     model_kwargs={"temperature": 0.1, "max_new_tokens": 100}
 )
 
-BASE_URL = "https://info.fusion.ciemat.es/cgi-bin/TJII_data.cgi"
+BASE_URL = os.getenv("TJII_BASE_URL", "https://info.fusion.ciemat.es/cgi-bin/TJII_data.cgi")
+
+# Known TJ-II signal names for the rule-based request parser
+SIGNAL_NAMES = plotparser.load_signal_names()
+SIGNAL_LOOKUP = plotparser.build_signal_lookup(SIGNAL_NAMES)
+
+# Plot geometry; signals are decimated to the figure's pixel width before plotting
+PLOT_FIGSIZE = (10, 6)
+PLOT_DPI = 100
+PLOT_WIDTH_PX = PLOT_FIGSIZE[0] * PLOT_DPI
+
+# Windowed fetching: long ranges are split into sub-windows of this many ms
+# that are fetched concurrently (0 disables; overridable per request)
+TJII_WINDOW_MS = float(os.getenv("TJII_WINDOW_MS", "0"))
+TJII_MAX_WINDOWS = int(os.getenv("TJII_MAX_WINDOWS", "8"))
+
+# Multi-shot comparisons: at most this many (shot, signal) fetches in flight
+MULTIPLOT_CONCURRENCY = int(os.getenv("MULTIPLOT_CONCURRENCY", "8"))
+MULTIPLOT_MAX_SERIES = int(os.getenv("MULTIPLOT_MAX_SERIES", "64"))
 
 def save_shotllama2_context(question, plot_path=None):
     context_file = os.path.join(CONTEXT_DIR, "shotllama2_history.json")
@@ -106,6 +137,15 @@ def parse_user_input_with_ai(user_input):
     except json.JSONDecodeError:
         return None
 
+async def parse_user_input(user_input):
+    """Parses a plot request with the rule-based parser, asking the LLM only
+    when the request is incomplete or ambiguous."""
+    parsed = plotparser.parse_plot_request(user_input, SIGNAL_NAMES, SIGNAL_LOOKUP)
+    if parsed:
+        print("⚡ Rule-based parse:", parsed)
+        return parsed
+    return await run_in_threadpool(parse_user_input_with_ai, user_input)
+
 def generate_url(shot, nsignal, signals, factors, tstart, tstop):
     tstart = 0 if tstart is None else tstart
     tstop = 2000 if tstop is None else tstop
@@ -117,39 +157,211 @@ def generate_url(shot, nsignal, signals, factors, tstart, tstop):
     url += f"&tstart={tstart:.2f}&tstop={tstop:.2f}"
     return url
 
-def fetch_data(url):
-    response = requests.get(url, verify=False)
-    return response.text if response.status_code == 200 else None
+async def fetch_data(url):
+    try:
+        return await httpclient.get_text(url)
+    except httpx.HTTPError as e:
+        print(f"❌ Error fetching {url}: {e}")
+        return None
 
 def extract_data_points(html_content, signals):
+    """Returns {signal_name: (times, values)} parsed from the TJII_data.cgi page."""
     data_points_dict = {}
-    matches = list(re.finditer(r"var data(\d{2}) = \[(.*?)\];", html_content, re.DOTALL))
-    for signal_name in signals:
-        match = next((m for m in matches if f"var data{signals.index(signal_name)+1:02}" in m.group(0)), None)
-        if match:
-            data_block = match.group(2)
-            data_points = [tuple(map(float, line.strip('[]').split(','))) for line in data_block.split('],[')]
-            data_points_dict[signal_name] = data_points
+    blocks = {int(m.group(1)): m.group(2) for m in re.finditer(r"var data(\d{2}) = \[(.*?)\];", html_content, re.DOTALL)}
+    for i, signal_name in enumerate(signals, start=1):
+        data_block = blocks.get(i)
+        if data_block:
+            values = np.array(data_block.replace("[", "").replace("]", "").split(","), dtype=np.float64)
+            data_points_dict[signal_name] = (values[0::2], values[1::2])
     return data_points_dict
 
-def plot_data(data_points_dict):
-    fig, ax = plt.subplots(figsize=(10, 6))
-    for signal_name, data_points in data_points_dict.items():
-        if not data_points:
+def split_windows(tstart, tstop, window_ms):
+    """Splits [tstart, tstop] into at most TJII_MAX_WINDOWS sub-windows."""
+    if not window_ms or window_ms <= 0 or tstop - tstart <= window_ms:
+        return [(tstart, tstop)]
+    n_windows = min(math.ceil((tstop - tstart) / window_ms), TJII_MAX_WINDOWS)
+    # The CGI takes 2-decimal times, so make adjacent windows share exact edges
+    edges = np.round(np.linspace(tstart, tstop, n_windows + 1), 2)
+    edges[0], edges[-1] = tstart, tstop
+    return [(float(start), float(stop)) for start, stop in zip(edges[:-1], edges[1:])]
+
+def stitch_windows(parts):
+    """Joins per-window (start, times, values) parts into one pair of arrays.
+
+    Adjacent windows share their boundary, so any sample at or before the
+    last time already kept is dropped.
+    """
+    times_parts, values_parts, last_t = [], [], -np.inf
+    for _, times, values in sorted(parts, key=lambda part: part[0]):
+        keep = times > last_t
+        if keep.any():
+            times_parts.append(times[keep])
+            values_parts.append(values[keep])
+            last_t = times_parts[-1][-1]
+    if not times_parts:
+        return None
+    return np.concatenate(times_parts), np.concatenate(values_parts)
+
+async def fetch_window(shot, signal, window_start, window_stop):
+    url = generate_url(shot, 1, [signal], ["1.00"], window_start, window_stop)
+    print(f"🌍 Generated URL: {url}")
+
+    html_content = await fetch_data(url)
+    if not html_content:
+        raise HTTPException(status_code=500, detail="Failed to fetch data from TJ-II")
+    return window_start, extract_data_points(html_content, [signal]).get(signal)
+
+async def fetch_range(shot, signal, range_start, range_stop, window_ms=0):
+    windows = split_windows(range_start, range_stop, window_ms)
+    parts = []
+    # Each page is parsed as soon as it arrives so only the decoded arrays,
+    # not all the HTML pages, are held in memory at once
+    for next_window in asyncio.as_completed([fetch_window(shot, signal, start, stop) for start, stop in windows]):
+        window_start, points = await next_window
+        if points is not None:
+            parts.append((window_start, *points))
+
+    stitched = stitch_windows(parts)
+    if stitched:
+        await run_in_threadpool(signalcache.store_signal, shot, signal, range_start, range_stop, *stitched)
+    else:
+        print(f"⚠️ TJ-II returned no data for signal {signal} in [{range_start}, {range_stop}]")
+
+async def fetch_signal(shot, signal, tstart, tstop, window_ms=TJII_WINDOW_MS):
+    """Returns (times, values) for one signal, fetching only the ranges not cached yet."""
+    missing = signalcache.missing_ranges(shot, signal, tstart, tstop)
+    await asyncio.gather(*(fetch_range(shot, signal, start, stop, window_ms) for start, stop in missing))
+    return signalcache.read_signal(shot, signal, tstart, tstop)
+
+async def fetch_signals(shot, signals, tstart, tstop, window_ms=TJII_WINDOW_MS):
+    """Fetches every signal concurrently (one CGI request each) and merges the results."""
+    results = await asyncio.gather(*(fetch_signal(shot, signal, tstart, tstop, window_ms) for signal in signals))
+    return {signal: (times, values) for signal, (times, values) in zip(signals, results) if len(times)}
+
+def encode_signals_raw(data_points_dict, header_fields):
+    """Packs signals as [uint32 header length][JSON header][float32 arrays].
+
+    The header lists, per signal, the sample count and the byte offsets of its
+    times and values arrays relative to the start of the binary section.
+    """
+    signals_header, arrays, offset = [], [], 0
+    for signal_name, (x_values, y_values) in data_points_dict.items():
+        times = np.ascontiguousarray(x_values, dtype="<f4")
+        values = np.ascontiguousarray(y_values, dtype="<f4")
+        signals_header.append({
+            "name": signal_name,
+            "length": len(times),
+            "times_offset": offset,
+            "values_offset": offset + times.nbytes,
+        })
+        arrays += [times.tobytes(), values.tobytes()]
+        offset += times.nbytes + values.nbytes
+
+    header = json.dumps({**header_fields, "dtype": "float32", "byteorder": "little",
+                         "signals": signals_header}).encode("utf-8")
+    header += b" " * (-(len(header) + 4) % 4)  # Keep the float32 section 4-byte aligned
+    return struct.pack("<I", len(header)) + header + b"".join(arrays)
+
+def encode_signals_arrow(data_points_dict, header_fields):
+    """Encodes signals as an Arrow IPC stream in long format (signal, time, value)."""
+    names = list(data_points_dict)
+    lengths = [len(x_values) for x_values, _ in data_points_dict.values()]
+    table = pa.table({
+        "signal": pa.DictionaryArray.from_arrays(
+            pa.array(np.repeat(np.arange(len(names), dtype=np.int32), lengths)), pa.array(names)),
+        "time": pa.array(np.concatenate([x for x, _ in data_points_dict.values()]).astype(np.float32)),
+        "value": pa.array(np.concatenate([y for _, y in data_points_dict.values()]).astype(np.float32)),
+    }).replace_schema_metadata({"tjii": json.dumps(header_fields)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+async def plot_data(data_points_dict):
+    """Renders the signals on the plot worker pool and returns a PNG buffer."""
+    series = []
+    for signal_name, (x_values, y_values) in data_points_dict.items():
+        if len(x_values) == 0:
             print(f"⚠️ No data for signal {signal_name}, skipping plot.")
             continue
-        x_values, y_values = zip(*data_points)
-        ax.plot(x_values, y_values, label=signal_name, linewidth=1.5)
-    ax.set_title("TJ-II Plasma Signals")
-    ax.set_xlabel("Time")
-    ax.set_ylabel("Value")
-    ax.legend()
-    ax.grid()
-    img_buffer = BytesIO()
-    plt.savefig(img_buffer, format="png")
-    img_buffer.seek(0)
-    plt.close(fig)
-    return img_buffer
+        series.append({"x": x_values, "y": y_values, "label": signal_name, "linewidth": 1.5})
+    spec = {
+        "figsize": PLOT_FIGSIZE,
+        "dpi": PLOT_DPI,
+        "format": "png",
+        "axes": [{
+            "title": "TJ-II Plasma Signals",
+            "xlabel": "Time",
+            "ylabel": "Value",
+            "series": series,
+            "legend": True,
+            "grid": True,
+        }],
+    }
+    return BytesIO(await plotrender.render(spec))
+
+def align_series(series_dict, tstart, tstop, n_points):
+    """Resamples every series onto one shared time axis.
+
+    The axis spans the union of the series' time ranges within [tstart, tstop];
+    points outside a series' own range are NaN so matplotlib leaves a gap.
+    """
+    starts = [times[0] for times, _ in series_dict.values() if len(times)]
+    stops = [times[-1] for times, _ in series_dict.values() if len(times)]
+    if not starts:
+        return np.empty(0), {}
+    common_t = np.linspace(max(min(starts), tstart), min(max(stops), tstop), n_points)
+    aligned = {
+        key: np.interp(common_t, times, values, left=np.nan, right=np.nan)
+        for key, (times, values) in series_dict.items() if len(times)
+    }
+    return common_t, aligned
+
+async def plot_multi_shot(shots, signals, series_dict, layout):
+    """Renders an overlay (one axes) or small multiples (one axes per signal).
+
+    series_dict maps (shot, signal) to (times, values); the series need not
+    share a time axis.
+    """
+    if layout == "overlay":
+        axes = [{
+            "title": "TJ-II Plasma Signals",
+            "xlabel": "Time",
+            "ylabel": "Value",
+            "series": [
+                {"x": series_dict[(shot, signal)][0], "y": series_dict[(shot, signal)][1],
+                 "label": f"{signal} #{shot}", "linewidth": 1.0}
+                for shot in shots for signal in signals if (shot, signal) in series_dict
+            ],
+            "grid": True,
+        }]
+    else:
+        axes = [{
+            "title": signal,
+            "xlabel": "Time" if i == len(signals) - 1 else "",
+            "ylabel": "Value",
+            "series": [
+                {"x": series_dict[(shot, signal)][0], "y": series_dict[(shot, signal)][1],
+                 "label": f"#{shot}", "linewidth": 1.0}
+                for shot in shots if (shot, signal) in series_dict
+            ],
+            "grid": True,
+        } for i, signal in enumerate(signals)]
+
+    spec = {
+        "figsize": (PLOT_FIGSIZE[0], PLOT_FIGSIZE[1] if layout == "overlay" else 3 * len(signals)),
+        "dpi": PLOT_DPI,
+        "format": "png",
+        "nrows": len(axes),
+        "sharex": True,
+        "axes": axes,
+    }
+    return await plotrender.render(spec)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await httpclient.close_client()
+    plotrender.shutdown_pool()
 
 @app.post("/get_tjii_plot")
 async def get_tjii_plot(request: Request):
@@ -161,7 +373,15 @@ async def get_tjii_plot(request: Request):
             raise HTTPException(status_code=400, detail="Missing 'user_query' in request")
 
         user_input = data["user_query"]
-        parsed_data = parse_user_input_with_ai(user_input)
+        decimate_method = request.query_params.get("decimate", "minmax")
+        if decimate_method not in decimation.DECIMATION_METHODS:
+            raise HTTPException(status_code=400, detail=f"Invalid 'decimate', expected one of {decimation.DECIMATION_METHODS}")
+        try:
+            window_ms = float(request.query_params.get("window_ms", TJII_WINDOW_MS))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid 'window_ms', expected a number")
+
+        parsed_data = await parse_user_input(user_input)
         print("🤖 Parsed Data:", parsed_data)
 
         if not parsed_data or "shot" not in parsed_data:
@@ -169,39 +389,203 @@ async def get_tjii_plot(request: Request):
 
         shot = parsed_data["shot"]
         signals = parsed_data.get("signals", ["Densidad2_"])
-        tstart = parsed_data.get("tstart", 0)
-        tstop = parsed_data.get("tstop", 2000)
-
-        print(f"🔹 Fetching data for Shot: {shot}, Signals: {signals}")
-
-        # Generate URL and fetch data
-        url = generate_url(shot, len(signals), signals, ["1.00"] * len(signals), tstart, tstop)  # ✅ Corrected
-        print(f"🌍 Generated URL: {url}")
+        tstart = parsed_data.get("tstart")
+        tstop = parsed_data.get("tstop")
+        tstart = 0.0 if tstart is None else float(tstart)
+        tstop = 2000.0 if tstop is None else float(tstop)
+
+        # Everything that determines the rendered pixels
+        key = plotstore.plot_key({
+            "shot": shot,
+            "signals": signals,
+            "tstart": tstart,
+            "tstop": tstop,
+            "decimate": decimate_method,
+            "figsize": PLOT_FIGSIZE,
+            "dpi": PLOT_DPI,
+        })
+        plot_path = plotstore.get_plot(key)
+
+        if plot_path:
+            print(f"⚡ Plot cache hit for Shot: {shot}, Signals: {signals}")
+            with open(plot_path, "rb") as f:
+                image = f.read()
+        else:
+            print(f"🔹 Fetching data for Shot: {shot}, Signals: {signals}")
 
-        html_content = fetch_data(url)
-        if not html_content:
-            raise HTTPException(status_code=500, detail="Failed to fetch data from TJ-II")
+            # Served from the on-disk signal cache; only uncovered ranges hit TJ-II
+            data_points_dict = await fetch_signals(shot, signals, tstart, tstop, window_ms)
+            if not data_points_dict:
+                raise HTTPException(status_code=500, detail="No signal data found")
 
-        data_points_dict = extract_data_points(html_content, signals)
-        if not data_points_dict:
-            raise HTTPException(status_code=500, detail="No signal data found")
+            # Reduce to ~2 points per pixel column; ?decimate=none plots raw samples
+            data_points_dict = {
+                signal: decimation.decimate(times, values, PLOT_WIDTH_PX, decimate_method)
+                for signal, (times, values) in data_points_dict.items()
+            }
 
-        img_buffer = plot_data(data_points_dict)
-        print("📊 Successfully generated plot")
-        plot_filename = f"plot_shot_{shot}.png"
-        plot_path = os.path.join("static", plot_filename)
+            image = (await plot_data(data_points_dict)).getvalue()
+            print("📊 Successfully generated plot")
+            plot_path = await run_in_threadpool(plotstore.put_plot, key, image)
 
-        with open(plot_path, "wb") as f:
-            f.write(img_buffer.getbuffer())
-        
         save_shotllama2_context(
             question=user_input,
             plot_path=plot_path
         )
-        return StreamingResponse(img_buffer, media_type="image/png")
+        return httpcache.cached_response(request, image, "image/png", etag=f'"{key}"')
 
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
         print(f"❌ Unexpected Error: {e}")
-        return JSONResponse(content={"error": str(e)}, status_code=500)
\ No newline at end of file
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.get("/get_tjii_data")
+async def get_tjii_data(
+    request: Request,
+    shot: int,
+    signals: str,
+    tstart: float = 0.0,
+    tstop: float = 2000.0,
+    decimate: str = "none",
+    width: int = Query(PLOT_WIDTH_PX, ge=1),
+    format: str = "raw",
+    window_ms: float = TJII_WINDOW_MS,
+):
+    """Returns parsed signal arrays for client-side plotting instead of a PNG.
+
+    `signals` is comma-separated. `format=raw` returns float32 arrays behind a
+    JSON header (see encode_signals_raw); `format=arrow` returns an Arrow IPC
+    stream. Supports ETag/If-None-Match and byte Range requests.
+    """
+    signal_list = [name.strip() for name in signals.split(",") if name.strip()]
+    if not signal_list:
+        raise HTTPException(status_code=400, detail="No signals requested")
+    if tstart >= tstop:
+        raise HTTPException(status_code=400, detail="Invalid time range, 'tstart' must be before 'tstop'")
+    if decimate not in decimation.DECIMATION_METHODS:
+        raise HTTPException(status_code=400, detail=f"Invalid 'decimate', expected one of {decimation.DECIMATION_METHODS}")
+    if format not in ("raw", "arrow"):
+        raise HTTPException(status_code=400, detail="Invalid 'format', expected 'raw' or 'arrow'")
+    if format == "arrow" and pa is None:
+        raise HTTPException(status_code=501, detail="Arrow output requires pyarrow")
+
+    data_points_dict = await fetch_signals(shot, signal_list, tstart, tstop, window_ms)
+    if not data_points_dict:
+        raise HTTPException(status_code=404, detail="No signal data found")
+
+    data_points_dict = {
+        signal: decimation.decimate(times, values, width, decimate)
+        for signal, (times, values) in data_points_dict.items()
+    }
+    header_fields = {"shot": shot, "tstart": tstart, "tstop": tstop, "decimate": decimate}
+
+    if format == "arrow":
+        body = encode_signals_arrow(data_points_dict, header_fields)
+        media_type = "application/vnd.apache.arrow.stream"
+    else:
+        body = encode_signals_raw(data_points_dict, header_fields)
+        media_type = "application/octet-stream"
+
+    # Archived shot data is immutable, so the body hash is a stable validator
+    return httpcache.cached_response(request, body, media_type,
+                                     headers={"Cache-Control": "public, max-age=86400"})
+
+@app.post("/get_tjii_multiplot")
+async def get_tjii_multiplot(request: Request):
+    """Compares signals across several shots in a single figure.
+
+    Body: {"shots": [...], "signals": [...], "tstart": 0, "tstop": 2000,
+    "layout": "overlay" | "grid", "decimate": "minmax" | "lttb" | "none"}.
+    All (shot, signal) combinations are fetched concurrently, at most
+    MULTIPLOT_CONCURRENCY at a time, and drawn on a shared time axis; raw
+    series are resampled onto it, decimated ones keep their own samples.
+    """
+    try:
+        data = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    print("📥 Incoming Multiplot Request:", data)
+
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Expected a JSON object")
+    shots = data.get("shots") or []
+    signals = data.get("signals") or ["Densidad2_"]
+    if not isinstance(shots, list):
+        raise HTTPException(status_code=400, detail="Invalid 'shots', expected a list of shot numbers")
+    if not isinstance(signals, list) or not all(isinstance(signal, str) and signal for signal in signals):
+        raise HTTPException(status_code=400, detail="Invalid 'signals', expected a list of signal names")
+    try:
+        shots = [int(shot) for shot in shots]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid 'shots', expected a list of shot numbers")
+    try:
+        tstart = float(data.get("tstart") if data.get("tstart") is not None else 0.0)
+        tstop = float(data.get("tstop") if data.get("tstop") is not None else 2000.0)
+        window_ms = float(data.get("window_ms", TJII_WINDOW_MS))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid 'tstart', 'tstop' or 'window_ms', expected numbers")
+    if tstart >= tstop:
+        raise HTTPException(status_code=400, detail="Invalid time range, 'tstart' must be before 'tstop'")
+    layout = data.get("layout", "overlay")
+    decimate_method = data.get("decimate", "minmax")
+
+    if not shots:
+        raise HTTPException(status_code=400, detail="Missing 'shots' in request")
+    if len(shots) * len(signals) > MULTIPLOT_MAX_SERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MULTIPLOT_MAX_SERIES} shot/signal combinations per plot")
+    if layout not in ("overlay", "grid"):
+        raise HTTPException(status_code=400, detail="Invalid 'layout', expected 'overlay' or 'grid'")
+    if decimate_method not in decimation.DECIMATION_METHODS:
+        raise HTTPException(status_code=400, detail=f"Invalid 'decimate', expected one of {decimation.DECIMATION_METHODS}")
+
+    key = plotstore.plot_key({
+        "shots": shots,
+        "signals": signals,
+        "tstart": tstart,
+        "tstop": tstop,
+        "layout": layout,
+        "decimate": decimate_method,
+        "figsize": PLOT_FIGSIZE,
+        "dpi": PLOT_DPI,
+    })
+    plot_path = plotstore.get_plot(key)
+
+    if plot_path:
+        with open(plot_path, "rb") as f:
+            image = f.read()
+    else:
+        semaphore = asyncio.Semaphore(MULTIPLOT_CONCURRENCY)
+
+        async def fetch_bounded(shot, signal):
+            async with semaphore:
+                return await fetch_signal(shot, signal, tstart, tstop, window_ms)
+
+        combos = [(shot, signal) for shot in shots for signal in signals]
+        results = await asyncio.gather(*(fetch_bounded(shot, signal) for shot, signal in combos))
+        series_dict = {combo: result for combo, result in zip(combos, results) if len(result[0])}
+        if not series_dict:
+            raise HTTPException(status_code=404, detail="No signal data found")
+
+        if decimate_method == "none":
+            # Raw series are aligned on a common axis at their own density
+            n_points = max(len(times) for times, _ in series_dict.values())
+            common_t, aligned = align_series(series_dict, tstart, tstop, n_points)
+            series_dict = {combo: (common_t, values) for combo, values in aligned.items()}
+        else:
+            # Decimated series keep their own x values: interpolating them onto a
+            # shared grid would clip the extremes the decimation kept
+            series_dict = {
+                combo: decimation.decimate(times, values, PLOT_WIDTH_PX, decimate_method)
+                for combo, (times, values) in series_dict.items()
+            }
+
+        image = await plot_multi_shot(shots, signals, series_dict, layout)
+        print(f"📊 Generated {layout} plot for {len(series_dict)} series")
+        plot_path = await run_in_threadpool(plotstore.put_plot, key, image)
+
+    save_shotllama2_context(
+        question=data.get("user_query") or f"Compare {', '.join(signals)} for shots {', '.join(map(str, shots))}",
+        plot_path=plot_path
+    )
+    return httpcache.cached_response(request, image, "image/png", etag=f'"{key}"')
@@ -0,0 +1,148 @@
+import os
+import re
+import json
+import threading
+import numpy as np
+
+# Persistent cache of decoded TJ-II signals, one directory per (shot, signal).
+# Shot data never changes once the discharge is archived, so every interval we
+# have fetched once can be served from disk forever.
+#
+# Layout:
+#   cache/signals/<shot>/<signal>/index.json       covered intervals + current file
+#   cache/signals/<shot>/<signal>/samples_<n>.npy  (2, N) float64 array: times, values
+SIGNAL_CACHE_DIR = os.getenv("SIGNAL_CACHE_DIR", os.path.join("cache", "signals"))
+os.makedirs(SIGNAL_CACHE_DIR, exist_ok=True)
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _safe_name(value):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(value))
+
+
+def _entry_dir(shot, signal):
+    return os.path.join(SIGNAL_CACHE_DIR, _safe_name(shot), _safe_name(signal))
+
+
+def _lock_for(shot, signal):
+    key = (str(shot), signal)
+    with _locks_guard:
+        if key not in _locks:
+            _locks[key] = threading.Lock()
+        return _locks[key]
+
+
+def _load_index(entry_dir):
+    index_file = os.path.join(entry_dir, "index.json")
+    if not os.path.exists(index_file):
+        return {"intervals": [], "generation": 0, "samples": None}
+    try:
+        with open(index_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️ Ignoring unreadable signal cache index {index_file}: {e}")
+        return {"intervals": [], "generation": 0, "samples": None}
+
+
+def _load_samples(entry_dir, index):
+    """Memory-maps the samples file of an entry, or returns None if it has none."""
+    if not index.get("samples"):
+        return None
+    samples_file = os.path.join(entry_dir, index["samples"])
+    if not os.path.exists(samples_file):
+        return None
+    return np.load(samples_file, mmap_mode="r")
+
+
+def merge_intervals(intervals):
+    """Merges overlapping or touching [start, stop] intervals."""
+    merged = []
+    for start, stop in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+
+def subtract_intervals(tstart, tstop, covered):
+    """Returns the parts of [tstart, tstop] that are not inside any covered interval."""
+    missing = []
+    cursor = tstart
+    for start, stop in merge_intervals(covered):
+        if stop <= cursor:
+            continue
+        if start >= tstop:
+            break
+        if start > cursor:
+            missing.append((cursor, start))
+        cursor = max(cursor, stop)
+    if cursor < tstop:
+        missing.append((cursor, tstop))
+    return missing
+
+
+def missing_ranges(shot, signal, tstart, tstop):
+    """Returns the (tstart, tstop) sub-ranges that still have to be fetched."""
+    index = _load_index(_entry_dir(shot, signal))
+    return subtract_intervals(tstart, tstop, index["intervals"])
+
+
+def read_signal(shot, signal, tstart, tstop):
+    """Returns (times, values) for [tstart, tstop] sliced from the cached arrays."""
+    entry_dir = _entry_dir(shot, signal)
+    samples = _load_samples(entry_dir, _load_index(entry_dir))
+    if samples is None:
+        return np.empty(0), np.empty(0)
+    times = samples[0]
+    lo = np.searchsorted(times, tstart, side="left")
+    hi = np.searchsorted(times, tstop, side="right")
+    return times[lo:hi], samples[1][lo:hi]
+
+
+def store_signal(shot, signal, tstart, tstop, times, values):
+    """Merges freshly fetched samples for [tstart, tstop] into the cache entry."""
+    entry_dir = _entry_dir(shot, signal)
+    os.makedirs(entry_dir, exist_ok=True)
+
+    with _lock_for(shot, signal):
+        index = _load_index(entry_dir)
+        previous = _load_samples(entry_dir, index)
+
+        new_samples = np.vstack([np.asarray(times, dtype=np.float64),
+                                 np.asarray(values, dtype=np.float64)])
+        if previous is not None and previous.shape[1]:
+            new_samples = np.hstack([np.asarray(previous), new_samples])
+
+        # Sort by time and drop samples fetched twice at interval boundaries
+        order = np.argsort(new_samples[0], kind="stable")
+        new_samples = new_samples[:, order]
+        _, unique_idx = np.unique(new_samples[0], return_index=True)
+        new_samples = np.ascontiguousarray(new_samples[:, unique_idx])
+
+        # Write a new generation instead of overwriting: readers may still
+        # have the previous file memory-mapped.
+        generation = index.get("generation", 0) + 1
+        samples_name = f"samples_{generation}.npy"
+        np.save(os.path.join(entry_dir, samples_name), new_samples)
+
+        new_index = {
+            "intervals": merge_intervals(index["intervals"] + [[float(tstart), float(tstop)]]),
+            "generation": generation,
+            "samples": samples_name,
+        }
+        tmp_index = os.path.join(entry_dir, "index.json.tmp")
+        with open(tmp_index, "w", encoding="utf-8") as f:
+            json.dump(new_index, f)
+        os.replace(tmp_index, os.path.join(entry_dir, "index.json"))
+
+        for filename in os.listdir(entry_dir):
+            if filename.startswith("samples_") and filename != samples_name:
+                try:
+                    os.remove(os.path.join(entry_dir, filename))
+                except OSError:
+                    pass  # Still mapped by a reader (Windows); retried on the next store
+
+    print(f"💾 Cached {new_samples.shape[1]} samples for shot {shot}, signal {signal}")
@@ -0,0 +1,84 @@
+import io
+import numpy as np
+import pandas as pd
+
+# Vectorized decoding of the SimilPatternTool Servlet7 payload: one
+# "time,amplitude" sample per line. Parsing goes through pandas' C CSV reader
+# in a single pass instead of a Python split()/float() loop per sample.
+# Malformed lines (wrong field count, non-numeric values) are skipped.
+
+# Stream decoding parses once this many characters of complete lines have arrived
+DECODE_BLOCK_CHARS = 1 << 20
+
+
+def decode_time_amplitude(text, dtype=np.float64):
+    """Parses "time,amplitude" lines into contiguous (times, amplitudes) arrays.
+
+    Lines with any other number of fields are dropped, wherever they appear:
+
+    >>> decode_time_amplitude("1,2,3\\n2,3\\n3,4\\n")
+    (array([2., 3.]), array([3., 4.]))
+    """
+    if not text or not text.strip():
+        return np.empty(0, dtype=dtype), np.empty(0, dtype=dtype)
+
+    # A third column catches 3-field lines (pandas skips longer ones). Without
+    # index_col=False a 3-field first line would turn "time" into the index.
+    frame = pd.read_csv(
+        io.StringIO(text),
+        header=None,
+        names=["time", "amplitude", "extra"],
+        index_col=False,
+        on_bad_lines="skip",
+        skip_blank_lines=True,
+        engine="c",
+    )
+    frame = frame[frame["extra"].isna()].drop(columns="extra")
+    # Columns containing a non-numeric line come back as strings
+    for column in frame.columns:
+        if not pd.api.types.is_numeric_dtype(frame[column]):
+            frame[column] = pd.to_numeric(frame[column], errors="coerce")
+    frame = frame.dropna()
+
+    return (np.ascontiguousarray(frame["time"].to_numpy(dtype=dtype)),
+            np.ascontiguousarray(frame["amplitude"].to_numpy(dtype=dtype)))
+
+
+class TimeAmplitudeDecoder:
+    """Incremental decoder for a streamed Servlet7 response.
+
+    feed() text chunks as they arrive; complete lines are decoded in blocks
+    of DECODE_BLOCK_CHARS so parsing overlaps with the download. finish()
+    decodes the remainder and returns the concatenated arrays.
+    """
+
+    def __init__(self, dtype=np.float64, block_chars=DECODE_BLOCK_CHARS):
+        self.dtype = dtype
+        self.block_chars = block_chars
+        self._pending = []
+        self._pending_chars = 0
+        self._times = []
+        self._amplitudes = []
+
+    def feed(self, chunk):
+        self._pending.append(chunk)
+        self._pending_chars += len(chunk)
+        if self._pending_chars >= self.block_chars:
+            buffer = "".join(self._pending)
+            cut = buffer.rfind("\n") + 1
+            self._pending = [buffer[cut:]]
+            self._pending_chars = len(buffer) - cut
+            self._decode(buffer[:cut])
+
+    def _decode(self, text):
+        times, amplitudes = decode_time_amplitude(text, self.dtype)
+        if len(times):
+            self._times.append(times)
+            self._amplitudes.append(amplitudes)
+
+    def finish(self):
+        self._decode("".join(self._pending))
+        self._pending, self._pending_chars = [], 0
+        if not self._times:
+            return np.empty(0, dtype=self.dtype), np.empty(0, dtype=self.dtype)
+        return np.concatenate(self._times), np.concatenate(self._amplitudes)
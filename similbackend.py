@@ -0,0 +1,186 @@
+import os
+import time
+import asyncio
+import httpx
+import httpclient
+
+# Client for the SimilPatternTool Java server (Servlet4/6/7). Every call has
+# connect/read deadlines, and a circuit breaker stops sending requests after
+# SIMILPATTERN_FAILURES consecutive failures: calls fail fast with
+# BackendUnavailable until SIMILPATTERN_COOLDOWN seconds have passed, then a
+# single trial request decides whether the circuit closes again. A background
+# probe checks the server every SIMILPATTERN_PROBE_INTERVAL seconds: failures
+# count against the breaker, so it also opens without user traffic, but since
+# the probe only reaches the server root, a healthy probe merely ends an expired
+# cooldown; only a real servlet call closes the circuit.
+SIMILPATTERN_URL = os.getenv("SIMILPATTERN_URL", "http://localhost:8080")
+SIMILPATTERN_TIMEOUT = httpx.Timeout(
+    float(os.getenv("SIMILPATTERN_READ_TIMEOUT", "30")),
+    connect=float(os.getenv("SIMILPATTERN_CONNECT_TIMEOUT", "2")),
+)
+SIMILPATTERN_FAILURES = int(os.getenv("SIMILPATTERN_FAILURES", "3"))
+SIMILPATTERN_COOLDOWN = float(os.getenv("SIMILPATTERN_COOLDOWN", "30"))
+SIMILPATTERN_PROBE_INTERVAL = float(os.getenv("SIMILPATTERN_PROBE_INTERVAL", "15"))
+PROBE_TIMEOUT = httpx.Timeout(2.0)
+
+
+class BackendUnavailable(Exception):
+    """Raised instead of calling the Java server while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` consecutive failures; open -> half-open
+    once `cooldown` seconds have passed; half-open lets one trial call through."""
+
+    def __init__(self, threshold=SIMILPATTERN_FAILURES, cooldown=SIMILPATTERN_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.last_failure_at = None
+        self.last_success_at = None
+        self._trial_in_flight = False
+
+    def allow(self):
+        """Raises BackendUnavailable unless a call may go through now."""
+        if self.state == "open":
+            if time.time() - self.opened_at < self.cooldown:
+                raise BackendUnavailable(f"SimilPatternTool circuit open after {self.failures} failures: {self.last_error}")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                raise BackendUnavailable("SimilPatternTool circuit half-open, trial request in flight")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        if self.state != "closed":
+            print("✅ SimilPatternTool backend recovered, circuit closed")
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.last_success_at = time.time()
+        self._trial_in_flight = False
+
+    def record_failure(self, error):
+        self._trial_in_flight = False
+        self._count_failure(error)
+
+    def probe_failed(self, error):
+        """Like record_failure, but leaves any trial call in flight alone."""
+        self._count_failure(error)
+
+    def probe_succeeded(self):
+        """Open -> half-open once the cooldown has passed; never closes the circuit."""
+        if self.state == "open" and time.time() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+
+    def _count_failure(self, error):
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        self.last_failure_at = time.time()
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                print(f"🚫 SimilPatternTool circuit opened: {self.last_error}")
+            self.state = "open"
+            self.opened_at = time.time()
+
+    def release(self):
+        """Ends a call that neither succeeded nor failed (e.g. it was cancelled)."""
+        self._trial_in_flight = False
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "last_error": self.last_error,
+            "last_failure_at": self.last_failure_at,
+            "last_success_at": self.last_success_at,
+            "opened_at": self.opened_at,
+        }
+
+
+breaker = CircuitBreaker()
+_last_probe = None
+_probe_task = None
+
+
+def _is_backend_failure(error):
+    """Timeouts, connection errors and 5xx count against the breaker; 4xx do not."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.HTTPError)
+
+
+async def iter_servlet(servlet, params, timeout=None):
+    """Streams a servlet response as text chunks through the circuit breaker.
+
+    Raises BackendUnavailable when the circuit is open, and httpx.HTTPError
+    for failed calls, like httpclient.iter_text.
+    """
+    breaker.allow()
+    try:
+        async for chunk in httpclient.iter_text(f"{SIMILPATTERN_URL}/{servlet}", params=params,
+                                                timeout=timeout or SIMILPATTERN_TIMEOUT):
+            yield chunk
+    except httpx.HTTPError as e:
+        if _is_backend_failure(e):
+            breaker.record_failure(e)
+        else:
+            breaker.release()
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    breaker.record_success()
+
+
+async def probe():
+    """One health check: any non-5xx answer from the server counts as up."""
+    global _last_probe
+    started = time.perf_counter()
+    try:
+        response = await httpclient.get_client().get(SIMILPATTERN_URL, timeout=PROBE_TIMEOUT)
+        ok, status = response.status_code < 500, response.status_code
+        error = None if ok else f"HTTP {response.status_code}"
+    except httpx.HTTPError as e:
+        ok, status, error = False, None, f"{type(e).__name__}: {e}"
+
+    _last_probe = {"ok": ok, "status": status, "error": error, "at": time.time(),
+                   "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+    if ok:
+        breaker.probe_succeeded()
+    else:
+        breaker.probe_failed(RuntimeError(error))
+    return _last_probe
+
+
+async def _probe_loop():
+    while True:
+        try:
+            await probe()
+        except Exception as e:
+            print(f"⚠️ SimilPatternTool health probe failed: {e}")
+        await asyncio.sleep(SIMILPATTERN_PROBE_INTERVAL)
+
+
+def start_probe():
+    global _probe_task
+    if _probe_task is None or _probe_task.done():
+        _probe_task = asyncio.create_task(_probe_loop())
+
+
+async def stop_probe():
+    global _probe_task
+    if _probe_task is not None:
+        _probe_task.cancel()
+        try:
+            await _probe_task
+        except asyncio.CancelledError:
+            pass
+    _probe_task = None
+
+
+def status():
+    return {"url": SIMILPATTERN_URL, **breaker.snapshot(), "last_probe": _last_probe}
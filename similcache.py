@@ -0,0 +1,66 @@
+import os
+import json
+import hashlib
+
+# Persistent cache of SimilPatternTool search results (Servlet4/Servlet6).
+# The similarity database only changes when it is rebuilt, so results are
+# keyed on the query parameters plus a database epoch. Bumping the epoch
+# (after a rebuild) invalidates every cached result at once.
+SIMILARITY_CACHE_DIR = os.getenv("SIMILARITY_CACHE_DIR", os.path.join("cache", "similarity"))
+EPOCH_FILE = os.path.join(SIMILARITY_CACHE_DIR, "epoch")
+os.makedirs(SIMILARITY_CACHE_DIR, exist_ok=True)
+
+
+def get_epoch():
+    """Current database epoch: SIMILARITY_DB_EPOCH if set, else the epoch file."""
+    if os.getenv("SIMILARITY_DB_EPOCH"):
+        return os.getenv("SIMILARITY_DB_EPOCH")
+    try:
+        with open(EPOCH_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or "0"
+    except OSError:
+        return "0"
+
+
+def bump_epoch():
+    """Starts a new epoch and drops every result cached under older ones."""
+    current = get_epoch()
+    new_epoch = str(int(current) + 1) if current.isdigit() else "1"
+    with open(EPOCH_FILE, "w", encoding="utf-8") as f:
+        f.write(new_epoch)
+
+    for filename in os.listdir(SIMILARITY_CACHE_DIR):
+        if filename.endswith(".json"):
+            try:
+                os.remove(os.path.join(SIMILARITY_CACHE_DIR, filename))
+            except OSError:
+                pass
+    print(f"🧹 Similarity cache invalidated, epoch is now {new_epoch}")
+    return new_epoch
+
+
+def _entry_path(params):
+    canonical = json.dumps({"epoch": get_epoch(), **params}, sort_keys=True, default=str)
+    key = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(SIMILARITY_CACHE_DIR, f"{key}.json")
+
+
+def get_results(params):
+    """Returns the cached result tuples for params, or None."""
+    path = _entry_path(params)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [tuple(item) for item in json.load(f)["results"]]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Ignoring unreadable similarity cache entry {path}: {e}")
+        return None
+
+
+def put_results(params, results):
+    path = _entry_path(params)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "epoch": get_epoch(), "results": [list(r) for r in results]}, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,212 @@
+import os
+import re
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# In-process similarity search, an alternative to the SimilPatternTool Java
+# servlets. Signals live in a local store, one (2, N) float64 array of
+# times/amplitudes per shot:
+#
+#   <SIMILARITY_STORE_DIR>/<database>/<shot>.npy
+#
+# Windowed search (the Servlet4 equivalent) slides the query over every shot
+# and computes the z-normalized Euclidean distance to every window at once
+# with FFT-based sliding dot products (MASS). Whole-shot search (the Servlet6
+# equivalent) compares z-normalized, resampled signals. Shots are searched in
+# parallel on a thread pool; NumPy's FFT releases the GIL.
+#
+# Select it with SIMILARITY_ENGINE=numpy (default: java).
+SIMILARITY_ENGINE = os.getenv("SIMILARITY_ENGINE", "java").lower()
+SIMILARITY_STORE_DIR = os.getenv("SIMILARITY_STORE_DIR", os.path.join("data", "similarity_store"))
+SIMILARITY_WORKERS = int(os.getenv("SIMILARITY_WORKERS", "0")) or os.cpu_count() or 1
+# Whole-shot comparisons resample every signal to this many points
+WHOLE_SHOT_POINTS = 1024
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SIMILARITY_WORKERS)
+    return _executor
+
+
+def _database_dir(database):
+    return os.path.join(SIMILARITY_STORE_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", database))
+
+
+def list_shots(database):
+    database_dir = _database_dir(database)
+    if not os.path.isdir(database_dir):
+        return []
+    return sorted(name[:-4] for name in os.listdir(database_dir) if name.endswith(".npy"))
+
+
+def load_signal(database, shot):
+    """Returns memory-mapped (times, amplitudes) for a stored shot, or None."""
+    path = os.path.join(_database_dir(database), f"{shot}.npy")
+    if not os.path.exists(path):
+        return None
+    samples = np.load(path, mmap_mode="r")
+    return samples[0], samples[1]
+
+
+def store_signal(database, shot, times, amplitudes):
+    database_dir = _database_dir(database)
+    os.makedirs(database_dir, exist_ok=True)
+    samples = np.vstack([np.asarray(times, dtype=np.float64), np.asarray(amplitudes, dtype=np.float64)])
+    np.save(os.path.join(database_dir, f"{shot}.npy"), samples[:, np.argsort(samples[0], kind="stable")])
+
+
+def znormalize(values):
+    std = values.std()
+    if std == 0 or not np.isfinite(std):
+        return np.zeros_like(values)
+    return (values - values.mean()) / std
+
+
+def mass_distance_profile(query, series):
+    """Z-normalized Euclidean distance between query and every window of series.
+
+    Uses FFT sliding dot products (Mueen's MASS): O(n log n) for all windows.
+    Flat windows (zero variance) get an infinite distance.
+    """
+    m, n = len(query), len(series)
+    q = znormalize(np.asarray(query, dtype=np.float64))
+    t = np.asarray(series, dtype=np.float64)
+
+    size = 1 << int(np.ceil(np.log2(n + m)))
+    dot = np.fft.irfft(np.fft.rfft(t, size) * np.fft.rfft(q[::-1], size), size)[m - 1:n]
+
+    cumsum = np.concatenate(([0.0], np.cumsum(t)))
+    cumsum2 = np.concatenate(([0.0], np.cumsum(t * t)))
+    mean = (cumsum[m:] - cumsum[:-m]) / m
+    var = (cumsum2[m:] - cumsum2[:-m]) / m - mean ** 2
+    std = np.sqrt(np.maximum(var, 0))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dist2 = 2 * (m - dot / std)
+    dist2[std < 1e-12] = np.inf
+    return np.sqrt(np.maximum(dist2, 0))
+
+
+def distance_to_confidence(distance, m):
+    """Maps a z-normalized distance to [0, 1]; 1 is a perfect match.
+
+    d^2 = 2m(1 - r) for Pearson correlation r, so this is max(r, 0).
+    """
+    return float(max(0.0, 1.0 - distance ** 2 / (2 * m)))
+
+
+def _resample_uniform(times, values, dt):
+    grid = np.arange(times[0], times[-1] + dt / 2, dt)
+    return grid, np.interp(grid, times, values)
+
+
+def best_window(database, shot, query, dt):
+    signal = load_signal(database, shot)
+    if signal is None:
+        return None
+    times, values = np.asarray(signal[0]), np.asarray(signal[1])
+    if len(times) < 2:
+        return None
+
+    # Match the query's sampling if this shot was recorded at another rate
+    shot_dt = np.median(np.diff(times))
+    if abs(shot_dt - dt) > 0.01 * dt:
+        times, values = _resample_uniform(times, values, dt)
+    m = len(query)
+    if len(values) < m:
+        return None
+
+    profile = mass_distance_profile(query, values)
+    idx = int(np.argmin(profile))
+    if not np.isfinite(profile[idx]):
+        return None
+    return (distance_to_confidence(profile[idx], m), shot, float(times[idx]), float(times[idx + m - 1]))
+
+
+def search_window(database, shot_number, tIni, tFin, match=32, shots=None):
+    """Finds the best match of the reference [tIni, tFin] pattern in every shot.
+
+    Returns (confidence, shot, tIni, tFin) tuples sorted by confidence, like
+    the parsed Servlet4 response.
+    """
+    reference = load_signal(database, shot_number)
+    if reference is None:
+        print(f"❌ Shot {shot_number} is not in the local {database} store")
+        return []
+    times, values = np.asarray(reference[0]), np.asarray(reference[1])
+    in_range = (times >= float(tIni)) & (times <= float(tFin))
+    if in_range.sum() < 4:
+        print(f"❌ Not enough samples of shot {shot_number} in [{tIni}, {tFin}]")
+        return []
+    query = values[in_range]
+    dt = float(np.median(np.diff(times[in_range])))
+
+    shots = shots if shots is not None else list_shots(database)
+    results = _get_executor().map(lambda shot: best_window(database, shot, query, dt), shots)
+    matches = [result for result in results if result is not None]
+    matches.sort(key=lambda result: result[0], reverse=True)
+    return matches[:int(match)]
+
+
+def whole_shot_vector(database, shot):
+    signal = load_signal(database, shot)
+    if signal is None or len(signal[0]) < 2:
+        return None
+    times, values = np.asarray(signal[0]), np.asarray(signal[1])
+    grid = np.linspace(times[0], times[-1], WHOLE_SHOT_POINTS)
+    return znormalize(np.interp(grid, times, values))
+
+
+def search_whole(database, shot_number, match=32, shots=None):
+    """Ranks whole shots by similarity to the reference shot.
+
+    Returns (confidence, shot) tuples sorted by confidence, like the parsed
+    Servlet6 response.
+    """
+    reference = whole_shot_vector(database, shot_number)
+    if reference is None:
+        print(f"❌ Shot {shot_number} is not in the local {database} store")
+        return []
+
+    shots = shots if shots is not None else list_shots(database)
+    vectors = list(_get_executor().map(lambda shot: whole_shot_vector(database, shot), shots))
+    matches = []
+    for shot, vector in zip(shots, vectors):
+        if vector is not None:
+            distance = np.linalg.norm(reference - vector)
+            matches.append((distance_to_confidence(distance, WHOLE_SHOT_POINTS), shot))
+    matches.sort(key=lambda result: result[0], reverse=True)
+    return matches[:int(match)]
+
+
+def import_from_servlet7(database, shots, base_url="http://localhost:8080"):
+    """Copies shots from the Java server's Servlet7 into the local store."""
+    import requests
+    import signaldecode
+
+    for shot in shots:
+        params = {"dbDirectory": "primitive_DB", "dbName": database, "signalName": database, "shotNumber": shot}
+        response = requests.get(f"{base_url}/Servlet7", params=params, timeout=60)
+        if response.status_code != 200:
+            print(f"❌ Servlet7 returned {response.status_code} for shot {shot}")
+            continue
+        times, amplitudes = signaldecode.decode_time_amplitude(response.text)
+        if len(times):
+            store_signal(database, shot, times, amplitudes)
+            print(f"💾 Stored {len(times)} samples of {database} for shot {shot}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Populate the local similarity store from Servlet7")
+    parser.add_argument("database", help="signal database, e.g. HALFAC4 or Densidad2_")
+    parser.add_argument("shots", help="shot range, e.g. 56900-56999")
+    parser.add_argument("--base-url", default=os.getenv("SIMILPATTERN_URL", "http://localhost:8080"))
+    args = parser.parse_args()
+
+    start, _, stop = args.shots.partition("-")
+    import_from_servlet7(args.database, [str(s) for s in range(int(start), int(stop or start) + 1)], args.base_url)
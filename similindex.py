@@ -0,0 +1,229 @@
+import os
+import argparse
+import numpy as np
+import similengine
+
+# Offline feature index over a similarity store database, used to prune
+# candidate shots before the exact MASS / whole-shot comparisons in
+# similengine. One compressed file per database:
+#
+#   <SIMILARITY_STORE_DIR>/<database>/_index.npz
+#
+# For every shot it keeps
+#   - PAA frames: mean and variance of each block of INDEX_FRAME samples,
+#     from which the z-normalized PAA of any frame-aligned window follows,
+#   - the leading INDEX_COEFFICIENTS orthonormal FFT coefficients of the
+#     resampled whole-shot vector.
+# Both give lower bounds on the z-normalized Euclidean distance, i.e. upper
+# bounds on the confidence a shot can reach. Shots are refined in order of
+# their bound and the search stops once no remaining shot can enter the top
+# results. The whole-shot bound is exact; the windowed bound assumes the match
+# starts on a frame boundary, so it is a close approximation.
+#
+# Build or refresh it after importing shots: python similindex.py Densidad2_
+INDEX_FILENAME = "_index.npz"
+INDEX_FRAME = int(os.getenv("SIMILARITY_INDEX_FRAME", "16"))
+INDEX_COEFFICIENTS = int(os.getenv("SIMILARITY_INDEX_COEFFICIENTS", "16"))
+
+_indexes = {}
+
+
+def _index_path(database):
+    return os.path.join(similengine._database_dir(database), INDEX_FILENAME)
+
+
+def _shot_path(database, shot):
+    return os.path.join(similengine._database_dir(database), f"{shot}.npy")
+
+
+def _shot_features(database, shot, frame, coefficients):
+    signal = similengine.load_signal(database, shot)
+    if signal is None or len(signal[0]) < 2:
+        return None
+    times, values = np.asarray(signal[0]), np.asarray(signal[1])
+    n_frames = len(values) // frame
+    blocks = values[:n_frames * frame].reshape(n_frames, frame)
+
+    vector = similengine.whole_shot_vector(database, shot)
+    spectrum = np.fft.rfft(vector, norm="ortho")[:coefficients]
+    return {
+        "mtime": os.path.getmtime(_shot_path(database, shot)),
+        "dt": float(np.median(np.diff(times))),
+        "frame_mean": blocks.mean(axis=1),
+        "frame_var": blocks.var(axis=1),
+        "spectrum": spectrum,
+    }
+
+
+def build_index(database, frame=INDEX_FRAME, coefficients=INDEX_COEFFICIENTS):
+    """Computes the feature index for every shot in the store and saves it."""
+    shots = similengine.list_shots(database)
+    executor = similengine._get_executor()
+    features = list(executor.map(lambda shot: _shot_features(database, shot, frame, coefficients), shots))
+    indexed = [(shot, f) for shot, f in zip(shots, features) if f is not None]
+
+    lengths = [len(f["frame_mean"]) for _, f in indexed]
+    np.savez_compressed(
+        _index_path(database),
+        shots=np.array([shot for shot, _ in indexed], dtype=str),
+        mtimes=np.array([f["mtime"] for _, f in indexed], dtype=np.float64),
+        dt=np.array([f["dt"] for _, f in indexed], dtype=np.float64),
+        offsets=np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))),
+        frame_mean=np.concatenate([f["frame_mean"] for _, f in indexed] or [[]]).astype(np.float32),
+        frame_var=np.concatenate([f["frame_var"] for _, f in indexed] or [[]]).astype(np.float32),
+        spectrum=np.array([f["spectrum"] for _, f in indexed], dtype=np.complex64).reshape(len(indexed), -1),
+        frame=frame,
+        points=similengine.WHOLE_SHOT_POINTS,
+    )
+    _indexes.pop(database, None)
+    print(f"🗂️ Indexed {len(indexed)} of {len(shots)} shots of {database}")
+    return len(indexed)
+
+
+def load_index(database):
+    """Returns the index for database as a dict of arrays, or None if not built."""
+    path = _index_path(database)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _indexes.get(database)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with np.load(path) as data:
+        index = {name: data[name] for name in data.files}
+    index["frame"] = int(index["frame"])
+    index["points"] = int(index["points"])
+    index["position"] = {str(shot): i for i, shot in enumerate(index["shots"])}
+    _indexes[database] = (mtime, index)
+    return index
+
+
+def _fresh_position(index, database, shot):
+    """Position of shot in the index, or None if it is missing or was re-imported."""
+    i = index["position"].get(str(shot))
+    if i is None:
+        return None
+    try:
+        if os.path.getmtime(_shot_path(database, shot)) > index["mtimes"][i]:
+            return None
+    except OSError:
+        return None
+    return i
+
+
+def _window_bound(index, i, query_paa):
+    """Upper bound on the confidence of any frame-aligned window of shot i."""
+    k = len(query_paa)
+    start, stop = index["offsets"][i], index["offsets"][i + 1]
+    if stop - start < k:
+        return -1.0
+    means = index["frame_mean"][start:stop].astype(np.float64)
+    variances = index["frame_var"][start:stop].astype(np.float64)
+    means -= means.mean()
+
+    def sliding_sum(x):
+        cumsum = np.concatenate(([0.0], np.cumsum(x)))
+        return cumsum[k:] - cumsum[:-k]
+
+    s1, s2 = sliding_sum(means), sliding_sum(means * means)
+    window_mean = s1 / k
+    window_std = np.sqrt(np.maximum(sliding_sum(variances) / k + s2 / k - window_mean ** 2, 0))
+    dot = np.correlate(means, query_paa, mode="valid")
+
+    # sum_j (q_j - (m_j - mean) / std)^2 over the frames of every window
+    with np.errstate(divide="ignore", invalid="ignore"):
+        paa_dist2 = (np.dot(query_paa, query_paa)
+                     - 2 * (dot - window_mean * query_paa.sum()) / window_std
+                     + (s2 - k * window_mean ** 2) / window_std ** 2)
+    paa_dist2[window_std < 1e-12] = np.inf
+    # d^2 >= frame * paa_dist2 and confidence = 1 - d^2 / (2 * k * frame)
+    return float(1.0 - np.min(paa_dist2) / (2 * k))
+
+
+def _refine(bounds, exact, match):
+    """Runs exact(shot) in order of decreasing bound until the top match results are settled."""
+    bounds.sort(key=lambda item: item[0], reverse=True)
+    executor = similengine._get_executor()
+    batch = similengine.SIMILARITY_WORKERS
+    matches = []
+    refined = 0
+    while refined < len(bounds):
+        if len(matches) >= match and bounds[refined][0] < matches[match - 1][0]:
+            break
+        shots = [shot for _, shot in bounds[refined:refined + batch]]
+        matches.extend(result for result in executor.map(exact, shots) if result is not None)
+        matches.sort(key=lambda result: result[0], reverse=True)
+        refined += len(shots)
+    print(f"🔎 Refined {refined} of {len(bounds)} candidate shots")
+    return matches[:match]
+
+
+def search_window(database, shot_number, tIni, tFin, match=32):
+    """similengine.search_window, pruned with the database index when one exists."""
+    index = load_index(database)
+    reference = similengine.load_signal(database, shot_number)
+    if index is None or reference is None:
+        return similengine.search_window(database, shot_number, tIni, tFin, match)
+
+    times, values = np.asarray(reference[0]), np.asarray(reference[1])
+    in_range = (times >= float(tIni)) & (times <= float(tFin))
+    frame = index["frame"]
+    k = int(in_range.sum()) // frame
+    if k < 2:
+        return similengine.search_window(database, shot_number, tIni, tFin, match)
+    query = values[in_range]
+    dt = float(np.median(np.diff(times[in_range])))
+    query_paa = similengine.znormalize(query[:k * frame]).reshape(k, frame).mean(axis=1)
+
+    bounds = []
+    for shot in similengine.list_shots(database):
+        i = _fresh_position(index, database, shot)
+        # Shots that are not indexed or sampled at another rate are always refined
+        if i is None or abs(index["dt"][i] - dt) > 0.01 * dt:
+            bounds.append((1.0, shot))
+        else:
+            bounds.append((_window_bound(index, i, query_paa), shot))
+
+    return _refine(bounds, lambda shot: similengine.best_window(database, shot, query, dt), int(match))
+
+
+def search_whole(database, shot_number, match=32):
+    """similengine.search_whole, pruned with the database index when one exists."""
+    index = load_index(database)
+    reference = similengine.whole_shot_vector(database, shot_number)
+    if index is None or reference is None or index["points"] != similengine.WHOLE_SHOT_POINTS:
+        return similengine.search_whole(database, shot_number, match)
+
+    coefficients = index["spectrum"].shape[1]
+    weights = np.full(coefficients, 2.0)
+    weights[0] = 1.0  # the DC term appears once in the full spectrum, the others twice
+    reference_spectrum = np.fft.rfft(reference, norm="ortho")[:coefficients]
+
+    bounds = []
+    for shot in similengine.list_shots(database):
+        i = _fresh_position(index, database, shot)
+        if i is None:
+            bounds.append((1.0, shot))
+            continue
+        lower_bound2 = float(np.sum(weights * np.abs(reference_spectrum - index["spectrum"][i]) ** 2))
+        bounds.append((1.0 - lower_bound2 / (2 * similengine.WHOLE_SHOT_POINTS), shot))
+
+    def exact(shot):
+        vector = similengine.whole_shot_vector(database, shot)
+        if vector is None:
+            return None
+        distance = np.linalg.norm(reference - vector)
+        return (similengine.distance_to_confidence(distance, similengine.WHOLE_SHOT_POINTS), shot)
+
+    return _refine(bounds, exact, int(match))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the pruning index of a similarity store database")
+    parser.add_argument("database", help="signal database, e.g. HALFAC4 or Densidad2_")
+    parser.add_argument("--frame", type=int, default=INDEX_FRAME, help="samples per PAA frame")
+    parser.add_argument("--coefficients", type=int, default=INDEX_COEFFICIENTS, help="FFT coefficients per shot")
+    args = parser.parse_args()
+
+    build_index(args.database, args.frame, args.coefficients)
@@ -1,18 +1,28 @@
 import os
 import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # Non-GUI backend for compatibility
-import matplotlib.pyplot as plt
 import google.generativeai as genai
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
-import requests
 import re
 import json
 from datetime import datetime
+import plotrender
+import asyncio
+import httpx
+import httpclient
+import signaldecode
+import similcache
+import similengine
+import similindex
+import similbackend
+import plotstore
+import decimation
+import httpcache
+import uuid
 
 CONTEXT_DIR = "context"
 os.makedirs(CONTEXT_DIR, exist_ok=True)
@@ -41,7 +51,28 @@ app.add_middleware(
 PLOT_DIR = "static"
 os.makedirs(PLOT_DIR, exist_ok=True)
 
-def save_similpattern_context(question, plot_path=None, pattern_summary=None, similar_shots=None):
+# SimilPatternTool Java server (Servlet4/6/7)
+SIMILPATTERN_URL = similbackend.SIMILPATTERN_URL
+# Similarity plot render tiers, each stored separately: the chat shows the
+# thumbnail; full resolution and SVG (for reports) are rendered on request
+SIMILARITY_PLOT_FIGSIZE = (10, 5)
+PLOT_TIERS = {
+    "thumb": {"dpi": 60, "format": "png", "width_px": 600},
+    "full": {"dpi": 300, "format": "png", "width_px": 3000},
+    "svg": {"dpi": 100, "format": "svg", "width_px": 2000},
+}
+PLOT_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+# Overall deadline (seconds) for fetching every shot of a similarity plot
+SERVLET7_DEADLINE = float(os.getenv("SERVLET7_DEADLINE", "20"))
+# Default number of hits returned per search (k) and results the servlets rank (match)
+SIMILARITY_TOP_K = 4
+SIMILARITY_MATCH = 32
+SIMILARITY_MAX_MATCH = 256
+# How /ask_gemini answers: "template" formats the results locally, "llm" asks Gemini
+RESPONSE_MODES = ("template", "llm")
+SIMILARITY_RESPONSE_MODE = os.getenv("SIMILARITY_RESPONSE_MODE", "template").lower()
+
+def save_similpattern_context(question, plot_path=None, pattern_summary=None, similar_shots=None, plot_key=None):
     context_file = os.path.join(CONTEXT_DIR, "similpattern_history.json")
 
     if pattern_summary:
@@ -60,6 +91,9 @@ def save_similpattern_context(question, plot_path=None, pattern_summary=None, si
         "plot_path": plot_path,
         "pattern_summary": summary
     }
+    if plot_key:
+        # Keeps every render tier of the plot from being evicted
+        new_entry["plot_key"] = plot_key
 
     try:
         if os.path.exists(context_file):
@@ -79,11 +113,12 @@ def save_similpattern_context(question, plot_path=None, pattern_summary=None, si
         print(f"❌ Error saving context: {e}")
         
 # Function to fetch similar signals
-def get_similar_signals(shot_number, database_name, tIni=None, tFin=None):
+def similarity_request(shot_number, database_name, tIni=None, tFin=None, match=SIMILARITY_MATCH):
+    """Returns (use_servlet4, servlet URL, servlet params) for a similarity search."""
     use_servlet4 = tIni not in ["", "0.0", None] and tFin not in ["", "0.0", None]
 
     if use_servlet4:
-        server_url_similar = "http://localhost:8080/Servlet4"
+        server_url_similar = f"{SIMILPATTERN_URL}/Servlet4"
         params_similar = {
             "dbDirectory": "primitive_DB",
             "dbName": database_name,
@@ -91,10 +126,10 @@ def get_similar_signals(shot_number, database_name, tIni=None, tFin=None):
             "shotNumber": shot_number,
             "tIni": tIni,
             "tFin": tFin,
-            "match": "32"
+            "match": str(match)
         }
     else:
-        server_url_similar = "http://localhost:8080/Servlet6"
+        server_url_similar = f"{SIMILPATTERN_URL}/Servlet6"
         params_similar = {
             "dbDirectory": "primitive_DB",
             "dbName": "TESTING",  # Cambia si quieres usar database_name
@@ -102,121 +137,215 @@ def get_similar_signals(shot_number, database_name, tIni=None, tFin=None):
             "shotNumber": shot_number,
             "tIni": "0.0",
             "tFin": "0.0",
-            "match": "32"
+            "match": str(match)
         }
+    return use_servlet4, server_url_similar, params_similar
 
-    print(f"📡 Fetching similar signals for shot: {shot_number} from database: {database_name}")
-
+def parse_similarity_line(line, use_servlet4):
+    """Parses one Servlet4 (shot tIni duration confidence) or Servlet6
+    (confidence shot) result line into a tuple, or None if it is not one."""
+    parts = line.split()
     try:
-        response_similar = requests.get(server_url_similar, params=params_similar)
-        print(f"✅ Raw Response from backend:\n{response_similar.text[:500]}")
-
-        if not response_similar.ok:
-            print(f"❌ Error: backend returned status {response_similar.status_code}")
-            return []
-
-        response_text = response_similar.text.strip().split("\n")
-        if len(response_text) < 3 or not response_text[2]:
-            print("❌ Error: Unexpected response format.")
-            return []
-
-        # Parse response depending on the servlet
-        similar_shots = []
-
         if use_servlet4:
-            filtered_lines = [line.strip() for line in response_text[2:] if len(line.split()) >= 4]
-            for line in filtered_lines[:4]:
-                parts = line.split()
-                shot = parts[0]
-                tIni_val = float(parts[1].replace(",", "."))
-                duration = float(parts[2].replace(",", "."))
-                confidence = float(parts[3].replace(",", "."))
-                tFin_val = tIni_val + duration
-                similar_shots.append((confidence, shot, tIni_val, tFin_val))
+            if len(parts) < 4:
+                return None
+            tIni_val = float(parts[1].replace(",", "."))
+            duration = float(parts[2].replace(",", "."))
+            confidence = float(parts[3].replace(",", "."))
+            return (confidence, parts[0], tIni_val, tIni_val + duration)
+        if len(parts) < 2:
+            return None
+        return (float(parts[0].replace(",", ".")), parts[1])
+    except ValueError:
+        return None
+
+async def iter_similar_signals(shot_number, database_name, tIni=None, tFin=None, match=SIMILARITY_MATCH):
+    """Yields similarity hits in servlet order as soon as each line is parsed.
+
+    Once the search completes, the full result list is stored in the cache.
+    """
+    use_servlet4, server_url_similar, params_similar = similarity_request(shot_number, database_name, tIni, tFin, match)
+
+    # Repeat searches are answered from the result cache until the database epoch changes
+    cache_params = {"servlet": "Servlet4" if use_servlet4 else "Servlet6",
+                    "engine": similengine.SIMILARITY_ENGINE, **params_similar}
+    cached = similcache.get_results(cache_params)
+    if cached is not None:
+        print(f"⚡ Similarity cache hit for shot {shot_number} in {database_name}")
+        for hit in cached:
+            yield hit
+        return
+
+    similar_shots = []
+    if similengine.SIMILARITY_ENGINE == "numpy":
+        # In-process search over the local signal store, no Java server needed.
+        # similindex prunes the candidate shots when the database has an index.
+        print(f"📡 Searching similar signals for shot: {shot_number} in local store: {database_name}")
+        if use_servlet4:
+            similar_shots = await run_in_threadpool(similindex.search_window, database_name, shot_number, tIni, tFin, match)
         else:
-            filtered_lines = [line.strip() for line in response_text[2:] if len(line.split()) >= 2]
-            similar_shots = [
-                (float(line.split()[0].replace(",", ".")), line.split()[1])
-                for line in filtered_lines[:4]
-            ]
-
-        print(f"✅ Parsed Similar Shots: {similar_shots}")
+            similar_shots = await run_in_threadpool(similindex.search_whole, database_name, shot_number, match)
+        for hit in similar_shots:
+            yield hit
+    else:
         print(f"📡 Request to {'Servlet4' if use_servlet4 else 'Servlet6'}: {server_url_similar} with params {params_similar}")
+        # Results are parsed line by line while the response streams in. The
+        # first two lines (after any leading blank lines) are a header.
+        header_lines, buffer = 2, ""
+        try:
+            async for chunk in similbackend.iter_servlet("Servlet4" if use_servlet4 else "Servlet6", params_similar):
+                *lines, buffer = (buffer + chunk).split("\n")
+                for line in lines:
+                    if header_lines:
+                        if line.strip() or header_lines < 2:
+                            header_lines -= 1
+                        continue
+                    hit = parse_similarity_line(line, use_servlet4)
+                    if hit is not None:
+                        similar_shots.append(hit)
+                        yield hit
+            hit = None if header_lines else parse_similarity_line(buffer, use_servlet4)
+            if hit is not None:
+                similar_shots.append(hit)
+                yield hit
+        except httpx.HTTPStatusError as e:
+            print(f"❌ Servlet answered HTTP {e.response.status_code}: {e}")
+            if e.response.status_code < 500:
+                # The servlet rejected the parameters (shot, database, range): the caller can fix that
+                raise HTTPException(status_code=400, detail=f"SimilPatternTool rejected the request (HTTP {e.response.status_code})") from e
+            raise similbackend.BackendUnavailable(f"SimilPatternTool request failed: {e}") from e
+        except httpx.HTTPError as e:
+            print(f"❌ Error connecting to servlet: {e}")
+            raise similbackend.BackendUnavailable(f"SimilPatternTool request failed: {e}") from e
+        print(f"✅ Parsed Similar Shots: {similar_shots}")
 
-        return similar_shots
+    if similar_shots:
+        similcache.put_results(cache_params, similar_shots)
+
+async def get_similar_signals(shot_number, database_name, tIni=None, tFin=None, k=SIMILARITY_TOP_K, match=SIMILARITY_MATCH):
+    """Returns the top k of the match results of a similarity search."""
+    similar_shots = []
+    async for hit in iter_similar_signals(shot_number, database_name, tIni, tFin, match):
+        similar_shots.append(hit)
+    return similar_shots[:k]
+
+# Fetch one shot's signal from Servlet7, decoding it into arrays while it streams in.
+# Returns (times, amplitudes, ok); ok is False when the fetch failed, as opposed
+# to the shot legitimately having no samples.
+async def fetch_shot_signal(shot, signal_name):
+    server_url_signal = f"{SIMILPATTERN_URL}/Servlet7"
+    # Prepare request parameters to be sent for Servlet7
+    params_signal = {
+        "dbDirectory": "primitive_DB",
+        "dbName": signal_name,
+        "signalName": signal_name,
+        "shotNumber": shot
+    }
+
+    if similengine.SIMILARITY_ENGINE == "numpy":
+        signal = similengine.load_signal(signal_name, shot)
+        if signal is None:
+            print(f"⚠️ Shot {shot} is not in the local {signal_name} store")
+            return np.empty(0), np.empty(0), True
+        return np.array(signal[0]), np.array(signal[1]), True
+
+    print(f"📡 Request to Servlet7: {server_url_signal} with params {params_signal}")
+    decoder = signaldecode.TimeAmplitudeDecoder()
+    try:
+        async for chunk in similbackend.iter_servlet("Servlet7", params_signal,
+                                                     timeout=httpx.Timeout(SERVLET7_DEADLINE, connect=similbackend.SIMILPATTERN_TIMEOUT.connect)):
+            decoder.feed(chunk)
+    except (httpx.HTTPError, similbackend.BackendUnavailable) as e:
+        print(f"❌ Error fetching shot {shot} from Servlet7: {e}")
+        return np.empty(0), np.empty(0), False
+
+    times, amplitudes = decoder.finish()
+    print(f"🌟 Decoded {len(times)} samples from Servlet7 for shot {shot}")
+    return times, amplitudes, True
 
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error connecting to servlet: {e}")
-        return []
-    
 # Function to fetch and plot signals (adapted to use tIni/tFin ranges if available)
-def plot_signals(shot_number, similar_shots, signal_name, pattern_ranges=None):
-    server_url_signal = "http://localhost:8080/Servlet7"
+async def plot_signals(shot_number, similar_shots, signal_name, pattern_ranges=None, tier="thumb"):
+    """Renders the reference and similar shots; returns (plot key, file path of the tier)."""
     # Create a list of all shots to plot (reference + similar)
     similar_only = [shot[1] for shot in similar_shots if shot[1] != shot_number]
-    all_shots = [shot_number] + similar_only
-    plt.figure(figsize=(10, 5))
-
-    # Set up the plot
-    print(f"📡 Generating plot for signal: {signal_name}")
-    for shot in all_shots:
-        # Prepare request parameters to be sent for Servlet7
-        params_signal = {
-            "dbDirectory": "primitive_DB",  
-            "dbName": signal_name,
-            "signalName": signal_name,
-            "shotNumber": shot
-        }
-        
-        print(f"📡 Request to Servlet7: {server_url_signal} with params {params_signal}")
-
-        # Fetch the signal data from Servlet7
-        response_signal = requests.get(server_url_signal, params=params_signal)
-
-        if response_signal.status_code == 200:
-            response_text = response_signal.text.strip()
-            print(f"🌟 Response from Servlet7 for shot {shot}: {response_text[:200]}")
-            lines = response_text.split("\n")
-            times, amplitudes = [], []
-            
-            # Parse signal data into time and amplitude lists
-            for line in lines:
-                parts = line.split(",")
-                if len(parts) == 2:
-                    try:
-                        t, amp = float(parts[0]), float(parts[1])
-                        times.append(t)
-                        amplitudes.append(amp)
-                    except ValueError:
-                        continue
+    inputs = {"signal": signal_name, "shots": [shot_number] + similar_only, "ranges": pattern_ranges}
+    return await render_similarity_plot(inputs, tier)
+
+async def render_similarity_plot(inputs, tier, key=None):
+    """Returns (key, path) of a similarity plot tier, rendering it if it is not stored yet.
+
+    Every tier of a plot shares the key of its inputs and is stored separately
+    as plot_<key>-<tier>.<ext>; the inputs are kept so that other tiers can be
+    rendered on demand.
+    """
+    signal_name, all_shots, pattern_ranges = inputs["signal"], inputs["shots"], inputs["ranges"]
+    settings = PLOT_TIERS[tier]
+
+    # Identical plots (same shots, ranges and database epoch) reuse the stored files
+    key_params = {
+        "kind": "similpattern",
+        **inputs,
+        "engine": similengine.SIMILARITY_ENGINE,
+        "epoch": similcache.get_epoch(),
+        "figsize": SIMILARITY_PLOT_FIGSIZE,
+    }
+    key = key or plotstore.plot_key(key_params)
+    cached_path = plotstore.get_plot(f"{key}-{tier}", settings["format"])
+    if cached_path:
+        print(f"⚡ Plot cache hit for signal {signal_name}, shots {all_shots} ({tier})")
+        return key, cached_path
+    series = []
+
+    # Fetch every shot concurrently; render with whatever arrived by the deadline
+    print(f"📡 Generating {tier} plot for signal: {signal_name}")
+    tasks = {shot: asyncio.create_task(fetch_shot_signal(shot, signal_name)) for shot in all_shots}
+    done, pending = await asyncio.wait(tasks.values(), timeout=SERVLET7_DEADLINE)
+    for task in pending:
+        task.cancel()
+    if pending:
+        print(f"⚠️ {len(pending)} Servlet7 fetches missed the {SERVLET7_DEADLINE}s deadline")
+    complete = not pending
+
+    for shot, task in tasks.items():
+        if task not in done:
+            continue
+        times, amplitudes, ok = task.result()
+        complete = complete and ok
+
+        # If time ranges are specified (from Servlet4), filter the signal data
+        if pattern_ranges and shot in pattern_ranges:
+            t_min, t_max = pattern_ranges[shot]
+            in_range = (times >= t_min) & (times <= t_max)
+            if in_range.any():
+                times, amplitudes = times[in_range], amplitudes[in_range]
+            else:
+                continue  # Skip this shot if no data in range
+
+        # Plot the signal, min-max decimated to the tier's pixel width
+        if len(amplitudes) > 0:
+            times, amplitudes = decimation.decimate(times, amplitudes, settings["width_px"], "minmax")
+            series.append({"x": times, "y": amplitudes, "label": f"Shot {shot}", "linewidth": 0.5})
+
+    # Rendered on the shared plot worker pool, off the event loop
+    image = await plotrender.render({
+        "figsize": SIMILARITY_PLOT_FIGSIZE,
+        "dpi": settings["dpi"],
+        "format": settings["format"],
+        "axes": [{
+            "title": f"Signal {signal_name} and Similar Signals",
+            "xlabel": "Time",
+            "ylabel": "Amplitude",
+            "series": series,
+            "legend": True,
+        }],
+    })
+
+    if not complete:
+        # Don't let a plot with missing shots answer later requests for the full one
+        key = plotstore.plot_key({**key_params, "partial": uuid.uuid4().hex})
+    await run_in_threadpool(plotstore.put_spec, key, inputs)
+    return key, await run_in_threadpool(plotstore.put_plot, f"{key}-{tier}", image, settings["format"])
 
-            # If time ranges are specified (from Servlet4), filter the signal data
-            if pattern_ranges and shot in pattern_ranges:
-                t_min, t_max = pattern_ranges[shot]
-                filtered_points = [(t, a) for t, a in zip(times, amplitudes) if t_min <= t <= t_max]
-                if filtered_points:
-                    times, amplitudes = zip(*filtered_points)
-                else:
-                    continue  # Skip this shot if no data in range
-
-            # Plot the signal
-            if len(amplitudes) > 0:
-                plt.plot(times, amplitudes, label=f"Shot {shot}", linewidth=0.5)
-
-    plt.xlabel("Time")
-    plt.ylabel("Amplitude")
-    plt.title(f"Signal {signal_name} and Similar Signals")
-    plt.legend()
-
-    # Create unique filename to avoid caching
-    import uuid
-    unique_id = uuid.uuid4().hex[:6]
-    plot_filename = f"plot_{signal_name}_{shot_number}_{unique_id}.png"
-    plot_path = os.path.join(PLOT_DIR, plot_filename)
-    plt.savefig(plot_path, dpi=300)
-    plt.close()
-
-    return plot_path
 def clean_ai_response(text):
     """Removes markdown formatting like **bold**, *italic*, and converts it to plain text."""
     text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)  # Remove bold
@@ -224,54 +353,63 @@ def clean_ai_response(text):
     text = re.sub(r"\n\s*\n", "\n", text)  # Remove extra newlines
     return text.strip()
 
-@app.post("/ask_gemini")
-async def ask_gemini(request: Request):
+@app.on_event("startup")
+async def on_startup():
+    # The Java server is only needed (and probed) with the servlet engine
+    if similengine.SIMILARITY_ENGINE != "numpy":
+        similbackend.start_probe()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await similbackend.stop_probe()
+    await httpclient.close_client()
+    plotrender.shutdown_pool()
+
+def parse_ask_request(data):
+    """Extracts and validates the /ask_gemini request fields."""
+    shot_number = str(data.get("shot_number", "")).strip()
+    question = str(data.get("question", "")).strip()
+    database_name = str(data.get("database_name", "")).strip()
+    tIni = str(data.get("tIni", "")).strip()
+    tFin = str(data.get("tFin", "")).strip()
+
+    if not shot_number or not question or not database_name:
+        raise HTTPException(status_code=400, detail="Missing required data")
+
+    # k: hits returned; match: results the search ranks (at least k)
     try:
-        data = await request.json()
-        print(f"🔍 Incoming Data: {data}")
-
-        # Extracción de datos
-        shot_number = str(data.get("shot_number", "")).strip()
-        question = str(data.get("question", "")).strip()
-        database_name = str(data.get("database_name", "")).strip()
-        tIni = str(data.get("tIni", "")).strip()
-        tFin = str(data.get("tFin", "")).strip()
-
-        if not shot_number or not question or not database_name:
-            raise HTTPException(status_code=400, detail="Missing required data")
-
-        print(f"🔹 Extracted shot_number: {shot_number}, question: {question}, database_name: {database_name}")
-
-        # Obtener señales similares
-        similar_shots = get_similar_signals(shot_number, database_name, tIni, tFin)
-        if not similar_shots:
-            raise HTTPException(status_code=400, detail="No similar signals found.")
-
-        print(f"✅ Similar shots retrieved: {similar_shots}")
-
-        # Crear resumen tipo: 1,0000 - 56900 - [1020,018 , 1025,3019966]
-        pattern_summary = ""
-        if len(similar_shots[0]) == 4:  # Solo si incluye tIni y tFin (Servlet4)
-            pattern_summary = "\n".join([
-                f"{conf:.4f}".replace(".", ",") +
-                f" - {shot} - [{str(tini).replace('.', ',')} , {str(tfin).replace('.', ',')}]"
-                for conf, shot, tini, tfin in similar_shots
-            ])
-            print("📊 Pattern Summary:\n" + pattern_summary)
-
-        # Preparar data para Gemini
-        if len(similar_shots[0]) == 4:
-            similarity_data = "\n".join([
-                f"Shot {shot}: Confidence {conf:.4f}"
-                for conf, shot, _, _ in similar_shots
-            ])
-        else:
-            similarity_data = "\n".join([
-                f"Shot {shot}: Confidence {conf:.4f}"
-                for conf, shot in similar_shots
-            ])
-
-        prompt = f"""
+        k = int(data.get("k", SIMILARITY_TOP_K))
+        match = int(data.get("match", SIMILARITY_MATCH))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="k and match must be integers")
+    if not 1 <= k <= SIMILARITY_MAX_MATCH or not 1 <= match <= SIMILARITY_MAX_MATCH:
+        raise HTTPException(status_code=400, detail=f"k and match must be between 1 and {SIMILARITY_MAX_MATCH}")
+
+    mode = str(data.get("mode", SIMILARITY_RESPONSE_MODE)).strip().lower()
+    if mode not in RESPONSE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(RESPONSE_MODES)}")
+
+    return {"shot_number": shot_number, "question": question, "database_name": database_name,
+            "tIni": tIni, "tFin": tFin, "k": k, "match": max(match, k), "mode": mode}
+
+def build_pattern_summary(similar_shots):
+    # Crear resumen tipo: 1,0000 - 56900 - [1020,018 , 1025,3019966]
+    if len(similar_shots[0]) != 4:  # Solo si incluye tIni y tFin (Servlet4)
+        return ""
+    return "\n".join([
+        f"{conf:.4f}".replace(".", ",") +
+        f" - {shot} - [{str(tini).replace('.', ',')} , {str(tfin).replace('.', ',')}]"
+        for conf, shot, tini, tfin in similar_shots
+    ])
+
+def build_similarity_prompt(shot_number, question, similar_shots, pattern_summary):
+    # Preparar data para Gemini
+    similarity_data = "\n".join([
+        f"Shot {hit[1]}: Confidence {hit[0]:.4f}"
+        for hit in similar_shots
+    ])
+
+    return f"""
         You are assisting a plasma fusion researcher in analyzing signal similarity patterns.
 
         The reference discharge is: {shot_number}  
@@ -292,37 +430,207 @@ async def ask_gemini(request: Request):
         {pattern_summary or similarity_data}
         """
 
-        print(f"📡 Sending prompt to Gemini: {prompt[:200]}...")
+def summarize_similarity(shot_number, similar_shots, pattern_summary):
+    """Deterministic answer: the result list plus a short note on the confidence spread."""
+    def comma(value):
+        return f"{value:.4f}".replace(".", ",")
 
-        # Llamada a Gemini
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content(prompt)
-        cleaned_response = clean_ai_response(response.text)
+    if pattern_summary:
+        listing = pattern_summary.split("\n")
+    else:
+        listing = [comma(hit[0]) + f" - {hit[1]}" for hit in similar_shots]
+    lines = [f"Discharges similar to {shot_number}:"] + [f"- {item}" for item in listing]
+
+    others = [hit for hit in similar_shots if hit[1] != shot_number]
+    if not others:
+        lines.append("No other discharge matched the reference pattern.")
+        return "\n".join(lines)
+
+    confidences = np.array([hit[0] for hit in others])
+    best = others[int(np.argmax(confidences))]
+    strong = int((confidences >= 0.9).sum())
+    moderate = int(((confidences >= 0.7) & (confidences < 0.9)).sum())
+    weak = len(confidences) - strong - moderate
+    lines.append("")
+    lines.append(f"The closest match is discharge {best[1]} with a confidence of {comma(best[0])}.")
+    lines.append(f"Confidence ranges from {comma(confidences.min())} to {comma(confidences.max())} "
+                 f"(mean {comma(confidences.mean())}) across {len(confidences)} discharges: "
+                 f"{strong} strong (>= 0,9), {moderate} moderate (0,7 - 0,9), {weak} weak (< 0,7).")
+    if len(confidences) > 1:
+        spread = confidences.max() - confidences.min()
+        if spread < 0.05:
+            lines.append("The matches are closely grouped, so the pattern is common in this database.")
+        elif strong == 1:
+            lines.append(f"Discharge {best[1]} stands out clearly from the rest.")
+    return "\n".join(lines)
+
+def explain_similarity(prompt):
+    """Blocking Gemini call; run it in the threadpool."""
+    print(f"📡 Sending prompt to Gemini: {prompt[:200]}...")
+    model = genai.GenerativeModel(MODEL_NAME)
+    response = model.generate_content(prompt)
+    cleaned_response = clean_ai_response(response.text)
+    print(f"✅ Cleaned AI Response:\n{cleaned_response}")
+    return cleaned_response
+
+async def run_concurrently(*coroutines):
+    """Runs coroutines as tasks and returns their results in order. If one
+    fails, the others are cancelled and the error is re-raised."""
+    tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+def similarity_hit(hit):
+    """JSON form of a (confidence, shot[, tIni, tFin]) result tuple."""
+    if len(hit) == 4:
+        confidence, shot, tini, tfin = hit
+        return {"confidence": confidence, "shot": shot, "tIni": tini, "tFin": tfin}
+    return {"confidence": hit[0], "shot": hit[1]}
+
+def plot_url_for(plot_path):
+    relative_path = os.path.relpath(plot_path, PLOT_DIR).replace(os.sep, "/")
+    return f"http://localhost:5004/static/{relative_path}"
+
+def plot_tier_urls(key):
+    """URLs of every render tier of a similarity plot (rendered on first request)."""
+    return {tier: f"http://localhost:5004/similarity_plot/{key}?tier={tier}" for tier in PLOT_TIERS}
+
+@app.post("/ask_gemini")
+async def ask_gemini(request: Request):
+    try:
+        data = await request.json()
+        print(f"🔍 Incoming Data: {data}")
+
+        # Extracción de datos
+        ask = parse_ask_request(data)
+        shot_number, question, database_name = ask["shot_number"], ask["question"], ask["database_name"]
+        print(f"🔹 Extracted shot_number: {shot_number}, question: {question}, database_name: {database_name}")
 
-        print(f"✅ Cleaned AI Response:\n{cleaned_response}")
+        # Obtener señales similares
+        similar_shots = await get_similar_signals(shot_number, database_name, ask["tIni"], ask["tFin"],
+                                                  k=ask["k"], match=ask["match"])
+        if not similar_shots:
+            raise HTTPException(status_code=400, detail="No similar signals found.")
+
+        print(f"✅ Similar shots retrieved: {similar_shots}")
+
+        pattern_summary = build_pattern_summary(similar_shots)
+        if pattern_summary:
+            print("📊 Pattern Summary:\n" + pattern_summary)
 
-        # Generar gráfico
         signal_name = database_name
-        plot_path = plot_signals(shot_number, similar_shots, signal_name)
-        plot_url = f"http://localhost:5004/static/{os.path.basename(plot_path)}"
+        if ask["mode"] == "llm":
+            # Llamada a Gemini y gráfico: both depend only on similar_shots, so they run concurrently
+            prompt = build_similarity_prompt(shot_number, question, similar_shots, pattern_summary)
+            cleaned_response, (plot_key, plot_path) = await run_concurrently(
+                run_in_threadpool(explain_similarity, prompt),
+                plot_signals(shot_number, similar_shots, signal_name),
+            )
+        else:
+            cleaned_response = summarize_similarity(shot_number, similar_shots, pattern_summary)
+            plot_key, plot_path = await plot_signals(shot_number, similar_shots, signal_name)
+        plot_url = plot_url_for(plot_path)
 
         # Guardar contexto
         save_similpattern_context(
             question=question,
             plot_path=plot_path,
             pattern_summary=pattern_summary,
-            similar_shots=similar_shots
+            similar_shots=similar_shots,
+            plot_key=plot_key
         )
 
         return JSONResponse(content={
             "response": cleaned_response,
             "plot_url": plot_url,
-            "pattern_summary": pattern_summary
+            "plot_urls": plot_tier_urls(plot_key),
+            "pattern_summary": pattern_summary,
+            "mode": ask["mode"]
         })
 
+    except HTTPException:
+        raise
+    except similbackend.BackendUnavailable as e:
+        print(f"🚫 /ask_gemini degraded: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"❌ ERROR in /ask_gemini: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")    
+
+async def ask_gemini_events(ask):
+    """NDJSON events for /ask_gemini_stream: one "hit" per similarity result as
+    soon as it is parsed, then "explanation" and "plot" as each finishes (or "error")."""
+    def event(payload):
+        return json.dumps(payload) + "\n"
+
+    shot_number, question, database_name = ask["shot_number"], ask["question"], ask["database_name"]
+    similar_shots = []
+    try:
+        async for hit in iter_similar_signals(shot_number, database_name, ask["tIni"], ask["tFin"], ask["match"]):
+            # Keep draining after the top k so the full result list is cached
+            if len(similar_shots) < ask["k"]:
+                similar_shots.append(hit)
+                yield event({"type": "hit", **similarity_hit(hit)})
+        if not similar_shots:
+            yield event({"type": "error", "detail": "No similar signals found."})
+            return
+
+        pattern_summary = build_pattern_summary(similar_shots)
+        plot_task = asyncio.create_task(plot_signals(shot_number, similar_shots, database_name))
+        if ask["mode"] == "llm":
+            prompt = build_similarity_prompt(shot_number, question, similar_shots, pattern_summary)
+            explanation_task = asyncio.create_task(run_in_threadpool(explain_similarity, prompt))
+            pending = {explanation_task, plot_task}
+        else:
+            explanation_task = None
+            pending = {plot_task}
+            cleaned_response = summarize_similarity(shot_number, similar_shots, pattern_summary)
+            yield event({"type": "explanation", "response": cleaned_response, "pattern_summary": pattern_summary})
+
+        # Emit the explanation and the plot in whichever order they finish
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is explanation_task:
+                        yield event({"type": "explanation", "response": task.result(), "pattern_summary": pattern_summary})
+                    else:
+                        plot_key, plot_path = task.result()
+                        yield event({"type": "plot", "plot_url": plot_url_for(plot_path),
+                                     "plot_urls": plot_tier_urls(plot_key)})
+        finally:
+            for task in pending:
+                task.cancel()
+        plot_key, plot_path = plot_task.result()
+
+        save_similpattern_context(
+            question=question,
+            plot_path=plot_path,
+            pattern_summary=pattern_summary,
+            similar_shots=similar_shots,
+            plot_key=plot_key
+        )
+    except HTTPException as e:
+        yield event({"type": "error", "status": e.status_code, "detail": e.detail})
+    except similbackend.BackendUnavailable as e:
+        print(f"🚫 /ask_gemini_stream degraded: {e}")
+        yield event({"type": "error", "status": 503, "detail": str(e)})
+    except Exception as e:
+        print(f"❌ ERROR in /ask_gemini_stream: {str(e)}")
+        yield event({"type": "error", "detail": f"Server error: {str(e)}"})
+
+@app.post("/ask_gemini_stream")
+async def ask_gemini_stream(request: Request):
+    """Streaming variant of /ask_gemini (application/x-ndjson)."""
+    data = await request.json()
+    print(f"🔍 Incoming Data: {data}")
+    ask = parse_ask_request(data)
+    return StreamingResponse(ask_gemini_events(ask), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
         
 @app.post("/extract_shot_number_and_database")
 async def extract_shot_number_and_database(request: Request):
@@ -403,7 +711,42 @@ async def extract_shot_number_and_database(request: Request):
         print(f"❌ ERROR in /extract_shot_number_and_database: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
     
-@app.get("/static/{filename}")
-async def serve_plot(filename: str):
-    file_path = os.path.join(PLOT_DIR, filename)
-    return FileResponse(file_path, media_type="image/png")
\ No newline at end of file
+@app.post("/similarity_cache/invalidate")
+async def invalidate_similarity_cache():
+    """Call after rebuilding the SimilPatternTool database."""
+    return {"epoch": similcache.bump_epoch()}
+
+@app.get("/similpattern/status")
+async def similpattern_status():
+    """State of the SimilPatternTool backend: circuit breaker and last health probe."""
+    return {"engine": similengine.SIMILARITY_ENGINE,
+            "required": similengine.SIMILARITY_ENGINE != "numpy",
+            **similbackend.status()}
+
+@app.get("/similarity_plot/{key}")
+async def similarity_plot(request: Request, key: str, tier: str = "full"):
+    """Serves one render tier of a similarity plot, rendering it on first request."""
+    if tier not in PLOT_TIERS:
+        raise HTTPException(status_code=400, detail=f"tier must be one of {', '.join(PLOT_TIERS)}")
+    if not re.fullmatch(r"[0-9a-f]{32}", key):
+        raise HTTPException(status_code=404, detail="Plot not found")
+    ext = PLOT_TIERS[tier]["format"]
+    plot_path = plotstore.get_plot(f"{key}-{tier}", ext)
+    if plot_path is None:
+        inputs = plotstore.get_spec(key)
+        if inputs is None:
+            raise HTTPException(status_code=404, detail="Plot not found")
+        _, plot_path = await render_similarity_plot(inputs, tier, key=key)
+    # A key always renders to the same image, but the URL names the key rather than the
+    # file, so clients revalidate with the ETag instead of caching it as immutable
+    return httpcache.file_response(request, plot_path, media_type=PLOT_MEDIA_TYPES[ext], content_named=True)
+
+@app.get("/static/{filename:path}")
+async def serve_plot(request: Request, filename: str):
+    # Plots live in PLOT_DIR and the plot store below it (static/plots/)
+    file_path = httpcache.resolve_file(PLOT_DIR, filename)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Plot not found")
+    # Plot store names are hashes of the plot inputs, so their content never changes
+    immutable = os.path.dirname(file_path) == os.path.realpath(plotstore.PLOT_STORE_DIR)
+    return httpcache.file_response(request, file_path, immutable=immutable)
\ No newline at end of file
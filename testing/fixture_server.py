@@ -0,0 +1,137 @@
+import os
+import zlib
+import random
+import asyncio
+from functools import lru_cache
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse
+
+# Local stand-in for info.fusion.ciemat.es (TJII_data.cgi) and the
+# SimilPatternTool Java server (Servlet4/6/7), for benchmarking without
+# touching production. Responses mimic the formats the services parse.
+#
+# Run on the SimilPatternTool port and point the services at it:
+#   uvicorn --app-dir testing fixture_server:app --port 8080
+#   export TJII_BASE_URL=http://localhost:8080/cgi-bin/TJII_data.cgi
+#   export SIMILPATTERN_URL=http://localhost:8080
+#
+# Payload sizes and latencies come from the FIXTURE_* variables below and
+# can be changed at runtime with POST /fixture_config.
+
+config = {
+    # Added to every response: latency_ms + uniform(0, jitter_ms)
+    "latency_ms": float(os.getenv("FIXTURE_LATENCY_MS", "50")),
+    "jitter_ms": float(os.getenv("FIXTURE_JITTER_MS", "20")),
+    # TJII_data.cgi sample rate, and a cap on samples per signal and page
+    "cgi_samples_per_ms": float(os.getenv("FIXTURE_CGI_SAMPLES_PER_MS", "10")),
+    "cgi_max_samples": int(os.getenv("FIXTURE_CGI_MAX_SAMPLES", "200000")),
+    # Servlet7 samples per shot
+    "servlet7_samples": int(os.getenv("FIXTURE_SERVLET7_SAMPLES", "50000")),
+    # Result lines returned by Servlet4/Servlet6
+    "matches": int(os.getenv("FIXTURE_MATCHES", "32")),
+}
+
+app = FastAPI()
+
+
+async def simulate_latency():
+    delay_ms = config["latency_ms"] + random.uniform(0, config["jitter_ms"])
+    await asyncio.sleep(delay_ms / 1000)
+
+
+def synthetic_signal(shot, signal, times):
+    """Deterministic plasma-like waveform for a (shot, signal) pair."""
+    rng = np.random.default_rng(zlib.crc32(f"{int(shot)}:{signal}".encode()))
+    freq, phase, amplitude = rng.uniform(0.002, 0.02), rng.uniform(0, np.pi), rng.uniform(0.5, 2.0)
+    envelope = np.exp(-((times - 1100) / 400) ** 2)
+    noise = np.random.default_rng(int(shot)).normal(0, 0.05, len(times))
+    return amplitude * envelope * (1 + 0.3 * np.sin(freq * times + phase)) + noise
+
+
+@lru_cache(maxsize=256)
+def cgi_block(shot, signal, tstart, tstop):
+    n = int(min(max((tstop - tstart) * config["cgi_samples_per_ms"], 2), config["cgi_max_samples"]))
+    times = np.linspace(tstart, tstop, n)
+    values = synthetic_signal(shot, signal, times)
+    return "],[".join(f"{t:.4f},{v:.6f}" for t, v in zip(times, values))
+
+
+@lru_cache(maxsize=256)
+def servlet7_body(shot, signal):
+    times = np.linspace(0, 2000, config["servlet7_samples"])
+    values = synthetic_signal(shot, signal, times)
+    return "\n".join(f"{t:.4f},{v:.6f}" for t, v in zip(times, values))
+
+
+def similar_shots(shot):
+    rng = np.random.default_rng(int(shot))
+    others = [int(shot)] + [int(shot) + int(offset) for offset in rng.integers(-200, 200, config["matches"] - 1)]
+    confidences = np.sort(rng.uniform(0.5, 1.0, config["matches"]))[::-1]
+    confidences[0] = 1.0
+    return list(zip(confidences, others)), rng
+
+
+def decimal_comma(value, digits):
+    return f"{value:.{digits}f}".replace(".", ",")
+
+
+@app.get("/cgi-bin/TJII_data.cgi", response_class=HTMLResponse)
+async def tjii_data(request: Request):
+    await simulate_latency()
+    params = request.query_params
+    shot = int(params.get("shot", "0"))
+    tstart = float(params.get("tstart", "0"))
+    tstop = float(params.get("tstop", "2000"))
+    nsignal = int(params.get("nsignal", "1"))
+
+    scripts = []
+    for i in range(1, nsignal + 1):
+        signal = params.get(f"signal{i:02}", "")
+        if signal:
+            scripts.append(f"var data{i:02} = [[{cgi_block(shot, signal, tstart, tstop)}]];")
+    return "<html><head><script>\n" + "\n".join(scripts) + "\n</script></head><body></body></html>"
+
+
+@app.get("/Servlet4", response_class=PlainTextResponse)
+async def servlet4(shotNumber: str, tIni: str = "0.0", tFin: str = "0.0"):
+    await simulate_latency()
+    t_ini = float(tIni.replace(",", "."))
+    duration = max(float(tFin.replace(",", ".")) - t_ini, 1.0)
+    matches, rng = similar_shots(shotNumber)
+    lines = ["SimilPatternTool fixture", "shot tIni duration confidence"]
+    for confidence, shot in matches:
+        start = t_ini + rng.uniform(-20, 20)
+        lines.append(f"{shot} {decimal_comma(start, 3)} {decimal_comma(duration, 6)} {decimal_comma(confidence, 4)}")
+    return "\n".join(lines)
+
+
+@app.get("/Servlet6", response_class=PlainTextResponse)
+async def servlet6(shotNumber: str):
+    await simulate_latency()
+    matches, _ = similar_shots(shotNumber)
+    lines = ["SimilPatternTool fixture", "confidence shot"]
+    lines += [f"{decimal_comma(confidence, 4)} {shot}" for confidence, shot in matches]
+    return "\n".join(lines)
+
+
+@app.get("/Servlet7", response_class=PlainTextResponse)
+async def servlet7(shotNumber: str, signalName: str = "Densidad2_"):
+    await simulate_latency()
+    return servlet7_body(shotNumber, signalName)
+
+
+@app.get("/fixture_config")
+async def get_config():
+    return config
+
+
+@app.post("/fixture_config")
+async def update_config(request: Request):
+    updates = await request.json()
+    for key, value in updates.items():
+        if key in config:
+            config[key] = type(config[key])(value)
+    cgi_block.cache_clear()
+    servlet7_body.cache_clear()
+    return config
@@ -0,0 +1,128 @@
+import time
+import random
+import asyncio
+import argparse
+import httpx
+import numpy as np
+
+# Load generator for the backend services. Runs one or more scenarios with a
+# fixed number of concurrent clients and reports throughput and latency
+# percentiles per endpoint. Use it against testing/fixture_server.py to
+# measure changes before they reach production:
+#
+#   python testing/loadgen.py --scenario plot --scenario data --concurrency 16 --requests 500
+#   python testing/loadgen.py --scenario similarity --duration 60 --shots 56900-56950
+
+SHOT_SERVICE = "http://localhost:5003"
+SIMILPATTERN_SERVICE = "http://localhost:5004"
+REPORT_SERVICE = "http://localhost:5005"
+SIGNALS = ["Densidad2_", "ECE10", "ABOL11", "HALFAC4"]
+
+
+def scenario_plot(shot):
+    signal = random.choice(SIGNALS)
+    return "POST /get_tjii_plot", "POST", f"{SHOT_SERVICE}/get_tjii_plot", {
+        "json": {"user_query": f"Plot {signal} for shot {shot} from 0 to 2000"}
+    }
+
+
+def scenario_data(shot):
+    return "GET /get_tjii_data", "GET", f"{SHOT_SERVICE}/get_tjii_data", {
+        "params": {"shot": shot, "signals": ",".join(random.sample(SIGNALS, 2)), "decimate": "minmax"}
+    }
+
+
+def scenario_multiplot(shot):
+    return "POST /get_tjii_multiplot", "POST", f"{SHOT_SERVICE}/get_tjii_multiplot", {
+        "json": {"shots": [shot, shot + 1, shot + 2], "signals": ["Densidad2_"], "layout": "overlay"}
+    }
+
+
+def scenario_similarity(shot):
+    return "POST /ask_gemini", "POST", f"{SIMILPATTERN_SERVICE}/ask_gemini", {
+        "json": {
+            "shot_number": str(shot),
+            "question": f"Find signals similar to shot {shot}",
+            "database_name": random.choice(["Densidad2_", "HALFAC4"]),
+            "tIni": "1020.0",
+            "tFin": "1030.0",
+        }
+    }
+
+
+def scenario_report(shot):
+    return "GET /generate_report", "GET", f"{REPORT_SERVICE}/generate_report", {}
+
+
+SCENARIOS = {
+    "plot": scenario_plot,
+    "data": scenario_data,
+    "multiplot": scenario_multiplot,
+    "similarity": scenario_similarity,
+    "report": scenario_report,
+}
+
+
+def parse_shots(value):
+    start, _, stop = value.partition("-")
+    return list(range(int(start), int(stop or start) + 1))
+
+
+async def worker(client, scenarios, shots, deadline, remaining, results):
+    while time.perf_counter() < deadline:
+        if remaining is not None:
+            if remaining[0] <= 0:
+                return
+            remaining[0] -= 1
+        name, method, url, kwargs = random.choice(scenarios)(random.choice(shots))
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        results.setdefault(name, []).append((time.perf_counter() - started, ok))
+
+
+def report(results, elapsed):
+    print(f"\n{'endpoint':<28}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, samples in sorted(results.items()):
+        latencies = np.array([latency for latency, _ in samples]) * 1000
+        errors = sum(1 for _, ok in samples if not ok)
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(f"{name:<28}{len(samples):>9}{errors:>8}{len(samples) / elapsed:>9.1f}"
+              f"{p50:>9.0f}{p90:>9.0f}{p99:>9.0f}{latencies.max():>9.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load generator for the FastAPI backend services")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable, default: plot)")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--requests", type=int, help="total requests (default: run for --duration)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--shots", default="56900-56999",
+                        help="shot range to draw from; a narrow range exercises the caches")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    args = parser.parse_args()
+
+    scenarios = [SCENARIOS[name] for name in (args.scenario or ["plot"])]
+    shots = parse_shots(args.shots)
+    remaining = [args.requests] if args.requests else None
+    deadline = time.perf_counter() + (args.duration if not args.requests else float("inf"))
+    results = {}
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, scenarios, shots, deadline, remaining, results)
+                               for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(f"🚀 {sum(len(s) for s in results.values())} requests in {elapsed:.1f}s "
+          f"with {args.concurrency} clients")
+    report(results, elapsed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())